@@ -4,76 +4,333 @@ Python 2048 Game : Basic Console Based User Interface For Game Play
 Written by Matthew Starkey, University of Strathclyde
 """
 
-from py2048_classes import Board, Tile
+from py2048_classes import Board, Tile, RandomStream
+import py2048_instrument
+from py2048_bitboard import pack_state
+from py2048_heuristic import leaf_value
+from py2048_render import QuietRenderer, TextRenderer
+from py2048_results import ResultsWriter, game_record
+from collections import namedtuple
+import itertools
 import time
 import math
-import random
+import multiprocessing
 
+# Everything a search worker needs for one move's search.
+SearchJob = namedtuple('SearchJob', 'gridstate score merge_count posses deadline batch_size rng rollouts '
+                                    'instrumented max_plies full_every confidence crn antithetic')
 
-def main():
+# Every ordering of the moves; playing the first legal move of a random ordering
+# picks uniformly among the legal moves.
+MOVE_ORDERS = tuple(itertools.permutations(('UP', 'DOWN', 'LEFT', 'RIGHT')))
+
+# Rollouts every candidate gets before racing starts to drop any of them.
+MIN_RACE_ROLLOUTS = 20
+# Racing treats moves whose means are within this fraction of the leader's as
+# equally good, so near-ties do not run to the deadline.
+RACE_INDIFFERENCE = 0.01
+
+
+def main(batch_size=None, workers=None, agent=None, seed=None, rollouts=None, instrument=None, results=None,
+         trajectory=None, time_limit=2.95, max_plies=None, full_every=0, confidence=None, size=4,
+         renderer=None, book=None, book_depth=30, book_samples=500, crn=False, antithetic=False):
+    """Play one game with flat Monte Carlo search, or with agent if one is given.
+
+    An agent is any object with a choose_move(board) method, such as
+    py2048_expectimax.ExpectimaxAgent.  With batch_size set, rollouts run
+    batch_size at a time per candidate move on the NumPy batch simulator
+    instead of one by one through random_rollout.  With workers set, a process
+    pool of that size runs the search in parallel; the pool lives for the
+    whole game.  seed fixes the tile spawns and the rollout random streams.
+    Each move searches for time_limit seconds.  With rollouts set, each
+    candidate move gets that many rollouts instead, which makes the whole game
+    reproducible.  max_plies truncates rollouts after that many moves and
+    values the position with py2048_heuristic.leaf_value() (batched rollouts
+    use py2048_features.leaf_values(), the same estimate computed for the whole
+    batch), which is fitted to the score rollouts still make, so truncated and
+    full rounds average on one scale; with full_every
+    set, every full_every-th round of rollouts still plays to the end.  With
+    confidence set, candidates are raced: a move is dropped once its mean is
+    that many standard errors behind the leader's, and the search stops early
+    when a single move is left.  With crn set, the candidates share common
+    random numbers: every round draws one seed and each candidate's rollout
+    replays the same draws through coupled_rollout(), so candidates are
+    compared as paired samples (racing then tests the paired differences).
+    antithetic adds a second rollout per seed on the mirrored draws and
+    implies crn.
+    instrument is an optional py2048_instrument.Instrumentation that receives a
+    profile record for every move.  results is an optional
+    py2048_results.ResultsWriter that gets one record for the finished game.
+    trajectory is an optional py2048_trajectory.TrajectoryWriter that records
+    every state, move and spawn of the game.  size plays on a size x size
+    board; the agents, batched search, truncated rollouts and trajectories
+    work on packed 4x4 boards and need the default size.  renderer is a
+    py2048_render renderer for the per-move output, a TextRenderer by default;
+    pass a QuietRenderer for headless runs.  book is an optional
+    py2048_book.OpeningBook: for the first book_depth moves a position the book
+    has backed by at least book_samples rollouts is played straight from it,
+    and every other search result is added to it unless it was opened
+    read-only.
+    """
+    if size != 4 and (agent is not None or batch_size or max_plies is not None or trajectory is not None
+                      or book is not None):
+        raise ValueError("agents, batch_size, max_plies, trajectory and book need a 4x4 board")
     #    allmoves = ['UP','LEFT','DOWN','RIGHT']
-    board = Board()
+    if seed is None:
+        # Draw a seed anyway so every logged game can be replayed.
+        seed = RandomStream().seed_value()
+    game_rng, search_rng = RandomStream(seed).split(2)
+    board = Board(rng=game_rng, size=size)
     board.add_random_tiles(2)
-    print("main code")
+    renderer = TextRenderer() if renderer is None else renderer
+    renderer.message("main code")
 
     move_counter = 0
     move = None
     move_result = False
+    latencies = []
+    rollout_counts = []
+    if trajectory is not None:
+        trajectory.start_game(seed)
 
+    use_pool = workers and agent is None
+    pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(batch_size,)) if use_pool else None
     overalltime = time.time()
-    while True:
-        gridstate = board.export_state()
-        print("Number of successful moves:{}, Last move attempted:{}:, Move status:{}".format(move_counter, move,
-                                                                                              move_result))
-        print(board)
-        if not possible_moves(gridstate):
-            if board.get_max_tile()[0] < 2048:
-                print("You lost!")
+    try:
+        while True:
+            gridstate = board.export_state()
+            renderer.frame(board, "Number of successful moves:{}, Last move attempted:{}:, Move status:{}".format(
+                move_counter, move, move_result))
+            if not possible_moves(gridstate):
+                if trajectory is not None:
+                    trajectory.end_game(gridstate, board.score)
+                if board.get_max_tile()[0] < 2048:
+                    renderer.message("You lost!")
+                else:
+                    renderer.message("Congratulations - you won!")
+                break
+            begin = time.time()
+            score_before = board.score
+            if instrument is not None:
+                instrument.start_move()
+            ######################################
+            ######################################
+            if agent is not None:
+                move = agent.choose_move(board)
             else:
-                print("Congratulations - you won!")
-            break
-        begin = time.time()
-        ######################################
-        ######################################
-        scores = {}
-        moves = {}
-        posses = possible_moves(gridstate)
+                in_book = book is not None and move_counter < book_depth
+                entry = book.lookup(pack_state(gridstate)) if in_book else None
+                if entry is not None and entry.samples >= book_samples:
+                    move, done = entry.move, 0
+                else:
+                    move, done = monte_carlo_move(
+                        board, gridstate, begin + time_limit, pool=pool, workers=workers, batch_size=batch_size,
+                        rng=search_rng, rollouts=rollouts, instrument=instrument, max_plies=max_plies,
+                        full_every=full_every, confidence=confidence,
+                        book=book if in_book and book.writable else None, crn=crn, antithetic=antithetic)
+                rollout_counts.append(done)
 
-        for possible in posses:
-            scores[possible] = 0
-            moves[possible] = 0
+            board.make_move(move)
+            ######################################
+            ######################################
+            if instrument is not None:
+                instrument.finish_move(move_counter + 1, move, time.time() - begin, score=board.score)
+            latencies.append(time.time() - begin)
+            renderer.message("Move time:  {}".format(latencies[-1]))
+            board.add_random_tiles(1)
+            if trajectory is not None:
+                trajectory.record(gridstate, move, board.last_spawn(), score_before)
+            # Searches restore their snapshots, so the game board never needs its undo log.
+            board.clear_undo()
+            move_counter = move_counter + 1
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    average_move = (time.time() - overalltime) / move_counter
+    renderer.message("Average time per move: {}".format(average_move))
+    renderer.close()
+    if results is not None:
+        results.write(game_record(seed, board, latencies, rollout_counts))
+    return board.score, average_move
+
+
+def monte_carlo_move(board, gridstate, deadline, *, pool=None, workers=None, batch_size=None, rng=None,
+                     rollouts=None, instrument=None, max_plies=None, full_every=0, confidence=None, book=None,
+                     crn=False, antithetic=False):
+    """Pick the move with the best mean rollout score; returns (move, rollouts played).
+
+    Everything after deadline is keyword-only, as the options keep growing.
+
+    Searches until the deadline, or until every candidate has had rollouts
+    rollouts (shared out between the workers) when that is set.  A lone legal
+    move is returned without searching.  See main() for max_plies, full_every,
+    confidence, crn and antithetic.  The result is recorded in book, a py2048_book.OpeningBook,
+    when one is given.
+    """
+    rng = RandomStream() if rng is None else rng
+    scores = {}
+    moves = {}
+    posses = possible_moves(gridstate)
+    if len(posses) == 1:
+        return posses[0], 0
 
-        while time.time() - begin < 2.95:
-            for possible in posses:
-                scores[possible] += random_rollout(board, possible)
-                moves[possible] += 1
+    for possible in posses:
+        scores[possible] = 0
+        moves[possible] = 0
 
+    streams = rng.split(workers if pool else 1)
+    share = None if rollouts is None else -(-rollouts // len(streams))
+    instrumented = instrument is not None
+    jobs = [SearchJob(gridstate, board.score, board.merge_count, posses, deadline, batch_size, stream, share,
+                      instrumented, max_plies, full_every, confidence, crn, antithetic)
+            for stream in streams]
+    results = pool.map(search_worker, jobs) if pool else [search_worker(jobs[0])]
+    # Moves still in the race in some worker; a move every worker dropped keeps a stale mean.
+    survivors = set()
+    for worker_scores, worker_moves, worker_alive, profile in results:
+        if instrumented:
+            instrument.merge(profile)
+        survivors.update(worker_alive)
         for possible in posses:
-            scores[possible] /= moves[possible]
-
-        best = 0
-        move = None
-        for key, value in scores.items():
-            if value > best:
-                best = value
-                move = key
-
-        board.make_move(move)
-        ######################################
-        ######################################
-        print("Move time: ", time.time() - begin)
-        board.add_random_tiles(1)
-        move_counter = move_counter + 1
-    average_move = (time.time() - overalltime) / move_counter
-    print("Average time per move:", (time.time() - overalltime) / move_counter)
-    return board.score, average_move
+            scores[possible] += worker_scores[possible]
+            moves[possible] += worker_moves[possible]
+
+    done = sum(moves.values())
+    for possible in posses:
+        scores[possible] /= moves[possible]
+
+    best = 0
+    move = None
+    for key, value in scores.items():
+        if key in survivors and value > best:
+            best = value
+            move = key
+    if book is not None:
+        book.record(pack_state(gridstate), move, best - board.score, moves[move])
+    return move, done
+
+
+def init_worker(batch_size):
+    """Prepare a pool process by loading the batch tables up front."""
+    if batch_size:
+        import py2048_batch
+
+
+def search_worker(job):
+    """Run rollouts for every candidate move until the deadline, or until each has rollouts of them.
+
+    Returns partial (scores, moves, alive, profile) totals so results from
+    several workers can be summed before picking the best move.  alive lists
+    the candidates racing has not dropped.  profile is a
+    py2048_instrument.MoveProfile when the job asks for instrumentation.
+    Batched search always plays rollouts to the end and is neither raced nor
+    paired.
+    """
+    posses = job.posses
+    profile = None
+    if job.instrumented:
+        profile, previous = py2048_instrument.begin_worker()
+    board = Board(job.gridstate, job.score, job.merge_count, job.rng)
+    scores = dict.fromkeys(posses, 0)
+    moves = dict.fromkeys(posses, 0)
+    alive = list(posses)
+    if job.batch_size:
+        batched_rollouts(board, posses, scores, moves, job.batch_size, job.deadline, job.rollouts, job.max_plies)
+    else:
+        rounds = 0
+        stats = {possible: py2048_instrument.RunningStats() for possible in posses}
+        paired = job.crn or job.antithetic
+        # Running statistics of the round-by-round difference between every two candidates.
+        differences = {(a, b): py2048_instrument.RunningStats() for a in posses for b in posses if a != b}
+        values = {}
+        # Always finish at least one round so every candidate has a sample.
+        while True:
+            # Every candidate gets the same kind of rollout in a round, so
+            # mixing truncated and full rounds keeps the means comparable.
+            full = job.full_every and rounds % job.full_every == 0
+            max_plies = None if full else job.max_plies
+            if paired:
+                seed = job.rng.seed_value()
+                streams = [RandomStream(seed)]
+                if job.antithetic:
+                    streams.append(RandomStream(seed, antithetic=True))
+            for possible in alive:
+                if paired:
+                    value, plies, played = paired_rollout(board, possible, streams, max_plies)
+                else:
+                    value, plies = measured_rollout(board, possible, max_plies)
+                    played = 1
+                scores[possible] += value * played
+                moves[possible] += played
+                stats[possible].add(value)
+                values[possible] = value
+                if profile is not None:
+                    profile.record_rollout(possible, plies, value)
+            if paired:
+                for a in alive:
+                    for b in alive:
+                        if a != b:
+                            differences[a, b].add(values[a] - values[b])
+            rounds += 1
+            if job.confidence is not None and rounds >= MIN_RACE_ROLLOUTS:
+                if paired:
+                    alive = race_paired(stats, differences, alive, job.confidence)
+                else:
+                    alive = race(stats, alive, job.confidence)
+                if len(alive) == 1:
+                    break
+            if search_finished(moves[alive[0]], job.deadline, job.rollouts):
+                break
+    if job.instrumented:
+        py2048_instrument.end_worker(previous)
+    return scores, moves, alive, profile
+
+
+def race(stats, alive, confidence):
+    """Keep the candidates that could still beat the leader by more than RACE_INDIFFERENCE.
+
+    A candidate survives while its mean plus confidence standard errors reaches
+    the leader's mean minus confidence standard errors, widened by the
+    indifference zone.
+    """
+    margins = {possible: confidence * math.sqrt(stats[possible].variance() / stats[possible].count)
+               for possible in alive}
+    leader = max(alive, key=lambda possible: stats[possible].mean)
+    floor = stats[leader].mean * (1 + RACE_INDIFFERENCE) - margins[leader]
+    return [possible for possible in alive
+            if possible == leader or stats[possible].mean + margins[possible] >= floor]
+
+
+def race_paired(stats, differences, alive, confidence):
+    """race() for paired samples: judge each candidate by its round-by-round difference from the leader."""
+    leader = max(alive, key=lambda possible: stats[possible].mean)
+    allowance = RACE_INDIFFERENCE * stats[leader].mean
+    survivors = []
+    for possible in alive:
+        if possible != leader:
+            lead = differences[leader, possible]
+            margin = confidence * math.sqrt(lead.variance() / lead.count)
+            # Drop the candidate once it cannot beat the leader by more than the indifference zone.
+            if margin - lead.mean < allowance:
+                continue
+        survivors.append(possible)
+    return survivors
+
+
+def search_finished(done, deadline, rollouts):
+    """Stop after rollouts rollouts per candidate if given, otherwise at the deadline."""
+    if rollouts is not None:
+        return done >= rollouts
+    return time.time() >= deadline
 
 
 # optimised possible moves
 def possible_moves(gridstate):
     all_moves = ('UP', 'DOWN', 'LEFT', 'RIGHT')
     possible = []
-    places = (0, 1, 2, 3)
+    places = range(len(gridstate))
+    last = len(gridstate) - 1
     for y in places:
         for x in places:
             current = gridstate[y][x]
@@ -88,7 +345,7 @@ def possible_moves(gridstate):
 
                 if all_moves[1] not in possible:
                     down = y+1
-                    if down <= 3:
+                    if down <= last:
                         test = gridstate[down][x]
                         if test is None or test == current:
                             possible.append(all_moves[1])
@@ -102,7 +359,7 @@ def possible_moves(gridstate):
 
                 if all_moves[3] not in possible:
                     right = x+1
-                    if right <= 3:
+                    if right <= last:
                         test = gridstate[y][right]
                         if test is None or test == current:
                             possible.append(all_moves[3])
@@ -113,25 +370,112 @@ def possible_moves(gridstate):
 
 
 def random_rollout(board, move):
-    gridstate = board.export_state()
-    scores = [board.score, board.merge_count]
+    return measured_rollout(board, move)[0]
+
+
+def measured_rollout(board, move, max_plies=None):
+    """Play a random rollout after move; returns (value, number of moves played).
+
+    The value is the final score, or the leaf_value() estimate of the position
+    reached if the rollout was cut off after max_plies moves.
+    """
+    snapshot = board.snapshot()
+    plies = 1
+    limit = float('inf') if max_plies is None else max_plies
 
     board.make_move(move)
     board.add_random_tiles(1)
 
-    grid = gridstate.copy()
-    possible = possible_moves(grid)
-    while not (board.is_board_full() and possible == []):
-        n = random.randint(0, len(possible) - 1)
+    possible = board.possible_moves()
+    while possible and plies < limit:
+        n = board.rng.randbelow(len(possible))
+        plies += 1
 
         board.make_move(possible[n])
         board.add_random_tiles(1)
 
-        grid = board.export_state()
-        possible = possible_moves(grid)
-    retscore = board.score
-    board.__init__(gridstate, scores[0], scores[1])
-    return retscore
+        possible = board.possible_moves()
+    if possible:
+        retscore = leaf_value(pack_state(board.export_state()), board.score)
+    else:
+        retscore = board.score
+    board.restore(snapshot)
+    return retscore, plies
+
+
+def coupled_rollout(board, move, rng, max_plies=None):
+    """measured_rollout() driven by rng so that rollouts fed the same words stay in step.
+
+    Each move takes one draw to pick an ordering from MOVE_ORDERS and plays the
+    first legal move in it, and each spawn picks among the empty cells in cell
+    order, so two rollouts sharing a stream make the same choices wherever
+    their boards allow.  Both choices stay uniform, as in measured_rollout().
+    """
+    saved = board.rng
+    board.rng = rng
+    snapshot = board.snapshot()
+    plies = 1
+    limit = float('inf') if max_plies is None else max_plies
+
+    board.make_move(move)
+    board.add_random_tiles(1, in_order=True)
+
+    finished = False
+    while plies < limit:
+        for possible in MOVE_ORDERS[rng.randbelow(24)]:
+            if board.can_move(possible):
+                break
+        else:
+            finished = True
+            break
+        plies += 1
+
+        board.make_move(possible)
+        board.add_random_tiles(1, in_order=True)
+    if finished or not board.possible_moves():
+        retscore = board.score
+    else:
+        retscore = leaf_value(pack_state(board.export_state()), board.score)
+    board.restore(snapshot)
+    board.rng = saved
+    return retscore, plies
+
+
+def paired_rollout(board, move, streams, max_plies=None):
+    """coupled_rollout() on a clone of each stream; returns (mean value, moves played, rollouts played)."""
+    total = 0
+    plies = 0
+    for stream in streams:
+        value, length = coupled_rollout(board, move, stream.clone(), max_plies)
+        total += value
+        plies += length
+    return total / len(streams), plies, len(streams)
+
+
+def batched_rollouts(board, posses, scores, moves, batch_size, deadline, rollouts=None, max_plies=None):
+    """Accumulate rollout totals into scores/moves using the NumPy batch simulator.
+
+    Rollouts cut off by max_plies are valued with py2048_features.leaf_values().
+    """
+    # NumPy is only needed for batched search, so import it here.
+    import numpy as np
+    from py2048_batch import MOVE_INDEX, batched_rollouts as simulate
+    from py2048_bitboard import pack_state
+    from py2048_features import leaf_values
+
+    packed = pack_state(board.export_state())
+    states = np.full(batch_size * len(posses), packed, dtype=np.uint64)
+    first_moves = np.repeat([MOVE_INDEX[p] for p in posses], batch_size)
+    generator = np.random.default_rng(board.rng.seed_value())
+    while True:
+        final_scores, _ = simulate(states, first_moves, board.score, board.merge_count, generator, max_plies,
+                                   leaf_values)
+        totals = final_scores.reshape(len(posses), batch_size).sum(axis=1)
+        for possible, total in zip(posses, totals):
+            scores[possible] += total.item()
+            moves[possible] += batch_size
+        if search_finished(moves[posses[0]], deadline, rollouts):
+            break
 
 
 if __name__ == "__main__":
@@ -141,24 +485,19 @@ if __name__ == "__main__":
     maxi = float('-inf')
     mini = float('inf')
     average_time = 0
-    for run in range(runs):
-        score, average_moves = main()
-        total += score
-        average_time += average_moves
-        if score < mini:
-            mini = score
-        if score > maxi:
-            maxi = score
-        results = open('resultsV3', 'a')
-        results.write('run ' + str(run + 1) + ' completed with score: ' + str(score) + '\n')
-        results.close()
+    with ResultsWriter('resultsV3.jsonl') as results:
+        for run in range(runs):
+            # Drawing every board is pure overhead in a batch run; the summary below is what matters.
+            score, average_moves = main(results=results, renderer=QuietRenderer())
+            total += score
+            average_time += average_moves
+            if score < mini:
+                mini = score
+            if score > maxi:
+                maxi = score
 
     average_time /= runs
-    average = total/runs
-    results = open('resultsV3', 'a')
-    results.write("finished " + str(runs) + ' with average score of: ' + str(average) + '       Average time of' + str(average_time) + '\n')
-    results.close()
-    print('average score: ', total/runs)
+    print('average score: ', total/runs, '  average time per move: ', average_time)
     print(mini)
     print(maxi)
 
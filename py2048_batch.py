@@ -0,0 +1,161 @@
+"""
+Python 2048 Game : NumPy Batched Rollout Simulator
+
+Plays thousands of random-policy games in lockstep.  Boards are packed uint64
+values in the py2048_bitboard layout, and every move, legality test and tile
+spawn is applied to the whole batch with a handful of array operations.
+
+Requires NumPy.
+"""
+
+import numpy as np
+
+from py2048_bitboard import MOVES, ROW_LEFT, ROW_RIGHT, COL_UP, COL_DOWN, STATS_BITS, STATS_MASK
+
+MOVE_INDEX = {move: i for i, move in enumerate(MOVES)}
+
+_ROW_MASK = np.uint64(0xFFFF)
+_NIBBLE = np.uint64(0xF)
+_CELL_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+_LINE_SHIFTS = [np.uint64(s) for s in (0, 16, 32, 48)]
+
+
+def _split_table(table):
+    results = np.array([e >> STATS_BITS for e in table], dtype=np.uint64)
+    stats = np.array([e & STATS_MASK for e in table], dtype=np.int64)
+    return results, stats >> 5, stats & 31
+
+
+# Indexed by MOVE_INDEX: (results, score gains, merges) per packed line.
+_TABLES = [_split_table(t) for t in (COL_UP, COL_DOWN, ROW_LEFT, ROW_RIGHT)]
+# Rows of the result land every 16 bits; spread columns land every 4 bits.
+_RESULT_SHIFTS = [[np.uint64(4 * k) for k in range(4)]] * 2 + [[np.uint64(16 * k) for k in range(4)]] * 2
+
+
+def pack_states(states):
+    """Pack an (N, 4, 4) array of exponents (0 for empty) into N uint64 boards."""
+    cells = np.asarray(states, dtype=np.uint64).reshape(-1, 16)
+    return np.bitwise_or.reduce(cells << _CELL_SHIFTS, axis=1)
+
+
+def unpack_states(boards):
+    """Inverse of pack_states()."""
+    boards = np.asarray(boards, dtype=np.uint64)
+    return ((boards[:, None] >> _CELL_SHIFTS) & _NIBBLE).astype(np.uint8).reshape(-1, 4, 4)
+
+
+def transpose(boards):
+    """Vectorized py2048_bitboard.transpose()."""
+    a1 = boards & np.uint64(0xF0F00F0FF0F00F0F)
+    a2 = boards & np.uint64(0x0000F0F00000F0F0)
+    a3 = boards & np.uint64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << np.uint64(12)) | (a3 >> np.uint64(12))
+    b1 = a & np.uint64(0xFF00FF0000FF00FF)
+    b2 = a & np.uint64(0x00FF00FF00000000)
+    b3 = a & np.uint64(0x00000000FF00FF00)
+    return b1 | (b2 >> np.uint64(24)) | (b3 << np.uint64(24))
+
+
+def move_boards(boards, move_index):
+    """Apply one move to every board; returns (new_boards, score_gains, merges)."""
+    results, scores, merges = _TABLES[move_index]
+    lines = transpose(boards) if move_index < 2 else boards
+    new = np.zeros_like(boards)
+    gain = np.zeros(len(boards), dtype=np.int64)
+    merged = np.zeros(len(boards), dtype=np.int64)
+    for line_shift, result_shift in zip(_LINE_SHIFTS, _RESULT_SHIFTS[move_index]):
+        index = ((lines >> line_shift) & _ROW_MASK).astype(np.intp)
+        new |= results[index] << result_shift
+        gain += scores[index]
+        merged += merges[index]
+    return new, gain, merged
+
+
+def move_all(boards):
+    """Apply all four moves; returns arrays of shape (4, N) in MOVES order."""
+    outcomes = [move_boards(boards, i) for i in range(4)]
+    return tuple(np.stack(parts) for parts in zip(*outcomes))
+
+
+def _pick_true(mask, rng):
+    """Pick a uniformly random True column per row of a boolean matrix (rows must have one)."""
+    counts = mask.sum(axis=1)
+    ranks = (rng.random(len(mask)) * counts).astype(np.intp)
+    return np.argmax(np.cumsum(mask, axis=1) > ranks[:, None], axis=1)
+
+
+def spawn_tiles(boards, rng):
+    """Add one tile (exponent 1 at 80%, 2 at 20%, as Board.add_random_tiles) to each non-full board."""
+    empty = ((boards[:, None] >> _CELL_SHIFTS) & _NIBBLE) == 0
+    has_space = empty.any(axis=1)
+    if not has_space.any():
+        return boards
+    cells = _pick_true(empty[has_space], rng).astype(np.uint64)
+    values = np.where(rng.random(len(cells)) < 0.2, np.uint64(2), np.uint64(1))
+    boards = boards.copy()
+    boards[has_space] |= values << (cells * np.uint64(4))
+    return boards
+
+
+def batched_rollouts(states, first_moves, scores=0, merge_counts=0, rng=None, max_plies=None, leaf=None):
+    """Play a random-policy rollout from every state after applying its first move.
+
+    states may be packed uint64 boards of shape (N,) or exponents of shape (N, 4, 4).
+    first_moves is a move name or an array of MOVE_INDEX codes.  A first move that
+    does not change its board leaves the game over at once, as in the engine.
+    Returns (final_scores, final_merge_counts) as int64 arrays.
+
+    With max_plies set, games still going after that many moves stop there;
+    leaf, given a function of the packed boards such as
+    py2048_features.leaf_values, then adds its estimate of the score still to
+    come, and final_scores are float64.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    boards = np.asarray(states)
+    boards = pack_states(boards) if boards.ndim == 3 else boards.astype(np.uint64)
+    n = len(boards)
+    if isinstance(first_moves, str):
+        first_moves = np.full(n, MOVE_INDEX[first_moves], dtype=np.intp)
+    first_moves = np.asarray(first_moves, dtype=np.intp)
+    score = np.zeros(n, dtype=np.int64) + scores
+    merged = np.zeros(n, dtype=np.int64) + merge_counts
+
+    new, gain, merges = move_all(boards)
+    games = np.arange(n)
+    chosen = new[first_moves, games]
+    alive = chosen != boards
+    score += np.where(alive, gain[first_moves, games], 0)
+    merged += np.where(alive, merges[first_moves, games], 0)
+
+    final_score = score.astype(np.float64) if leaf is not None else score.copy()
+    final_merged = merged.copy()
+    limit = float('inf') if max_plies is None else max_plies
+    plies = 1
+    active = np.flatnonzero(alive)
+    boards = spawn_tiles(chosen[active], rng)
+    score = score[active]
+    merged = merged[active]
+    while len(active):
+        new, gain, merges = move_all(boards)
+        legal = (new != boards[None, :]).T
+        alive = legal.any(axis=1)
+        if not alive.all():
+            done = ~alive
+            final_score[active[done]] = score[done]
+            final_merged[active[done]] = merged[done]
+            active, legal, boards = active[alive], legal[alive], boards[alive]
+            new, gain, merges = new[:, alive], gain[:, alive], merges[:, alive]
+            score, merged = score[alive], merged[alive]
+            if not len(active):
+                break
+        if plies >= limit:
+            final_score[active] = score + leaf(boards) if leaf is not None else score
+            final_merged[active] = merged
+            break
+        plies += 1
+        choice = _pick_true(legal, rng)
+        games = np.arange(len(active))
+        score += gain[choice, games]
+        merged += merges[choice, games]
+        boards = spawn_tiles(new[choice, games], rng)
+    return final_score, final_merged
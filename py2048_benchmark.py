@@ -0,0 +1,250 @@
+"""
+Python 2048 Game : Reproducible Benchmark Suite
+
+Runs seeded microbenchmarks of the Board primitives and a single rollout, plus
+macro benchmarks of full games with a fixed rollout count per candidate move,
+then reports throughput with latency percentiles.  Results can be written as
+JSON and compared against a saved baseline to flag regressions:
+
+    python py2048_benchmark.py --output baseline.json
+    python py2048_benchmark.py --baseline baseline.json --tolerance 0.1
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import MatthewStarkey2048
+from py2048_classes import Board, RandomStream
+
+MOVES = ('UP', 'DOWN', 'LEFT', 'RIGHT')
+
+
+def sample_positions(seed, count):
+    """Return count mid-game (state, score, merge_count) tuples from seeded random games."""
+    rng = RandomStream(seed)
+    positions = []
+    while len(positions) < count:
+        board = Board(rng=rng)
+        board.add_random_tiles(2)
+        while len(positions) < count:
+            possible = board.possible_moves()
+            if not possible:
+                break
+            positions.append((board.export_state(), board.score, board.merge_count))
+            board.make_move(possible[rng.randbelow(len(possible))])
+            board.add_random_tiles(1)
+    return positions
+
+
+def summarise(name, unit, per_op_seconds):
+    """Turn per-operation timings (one per sample) into throughput and percentile figures."""
+    cuts = statistics.quantiles(per_op_seconds, n=100, method='inclusive')
+    median = statistics.median(per_op_seconds)
+    return {
+        'name': name,
+        'unit': unit,
+        'per_sec': 1.0 / median,
+        'p50_us': cuts[49] * 1e6,
+        'p90_us': cuts[89] * 1e6,
+        'p99_us': cuts[98] * 1e6,
+        'samples': len(per_op_seconds),
+    }
+
+
+def _boards(positions, rng):
+    return [Board(state, score, merge_count, rng) for state, score, merge_count in positions]
+
+
+def bench_make_move(positions, samples, rng):
+    timings = []
+    for _ in range(samples):
+        boards = _boards(positions, rng)
+        begin = time.perf_counter()
+        for board, move in zip(boards, MOVES * len(boards)):
+            board.make_move(move)
+        timings.append((time.perf_counter() - begin) / len(boards))
+    return summarise('make_move', 'ops', timings)
+
+
+def bench_add_random_tiles(positions, samples, rng):
+    timings = []
+    for _ in range(samples):
+        boards = _boards(positions, rng)
+        begin = time.perf_counter()
+        for board in boards:
+            board.add_random_tiles(1)
+        timings.append((time.perf_counter() - begin) / len(boards))
+    return summarise('add_random_tiles', 'ops', timings)
+
+
+def bench_possible_moves(positions, samples, rng):
+    boards = _boards(positions, rng)
+    timings = []
+    for _ in range(samples):
+        begin = time.perf_counter()
+        for board in boards:
+            board.possible_moves()
+        timings.append((time.perf_counter() - begin) / len(boards))
+    return summarise('possible_moves', 'ops', timings)
+
+
+def bench_export_state(positions, samples, rng):
+    boards = _boards(positions, rng)
+    timings = []
+    for _ in range(samples):
+        begin = time.perf_counter()
+        for board in boards:
+            board.export_state()
+        timings.append((time.perf_counter() - begin) / len(boards))
+    return summarise('export_state', 'ops', timings)
+
+
+def bench_random_rollout(positions, samples, rng):
+    timings = []
+    for sample in range(samples):
+        state, score, merge_count = positions[sample % len(positions)]
+        board = Board(state, score, merge_count, rng)
+        move = board.possible_moves()[0]
+        begin = time.perf_counter()
+        MatthewStarkey2048.random_rollout(board, move)
+        timings.append(time.perf_counter() - begin)
+    return summarise('random_rollout', 'rollouts', timings)
+
+
+def bench_sized_rollouts(sizes, samples, rng):
+    """Random rollouts from fresh boards of each size; returns one result per size."""
+    results = []
+    for size in sizes:
+        timings = []
+        for _ in range(samples):
+            board = Board(rng=rng, size=size)
+            board.add_random_tiles(2)
+            move = board.possible_moves()[0]
+            begin = time.perf_counter()
+            MatthewStarkey2048.random_rollout(board, move)
+            timings.append(time.perf_counter() - begin)
+        results.append(summarise('random_rollout_{0}x{0}'.format(size), 'rollouts', timings))
+    return results
+
+
+MICROBENCHMARKS = (bench_make_move, bench_add_random_tiles, bench_possible_moves, bench_export_state,
+                   bench_random_rollout)
+
+
+def play_game(seed, rollouts):
+    """Play one headless flat Monte Carlo game with a fixed rollout count per candidate move.
+
+    Returns (score, per-move latencies in seconds, total rollouts).
+    """
+    game_rng, search_rng = RandomStream(seed).split(2)
+    board = Board(rng=game_rng)
+    board.add_random_tiles(2)
+    latencies = []
+    total_rollouts = 0
+    while True:
+        gridstate = board.export_state()
+        posses = MatthewStarkey2048.possible_moves(gridstate)
+        if not posses:
+            break
+        begin = time.perf_counter()
+        move, done = MatthewStarkey2048.monte_carlo_move(board, gridstate, None, rng=search_rng, rollouts=rollouts)
+        board.make_move(move)
+        board.add_random_tiles(1)
+        latencies.append(time.perf_counter() - begin)
+        # A lone legal move is played without rollouts, so count what the search reports.
+        total_rollouts += done
+    return board.score, latencies, total_rollouts
+
+
+def bench_games(seed, games, rollouts):
+    """Macro benchmark: full games; reports moves/sec with move-latency percentiles and rollouts/sec."""
+    latencies = []
+    total_rollouts = 0
+    scores = []
+    for game in range(games):
+        score, game_latencies, game_rollouts = play_game(seed + game, rollouts)
+        scores.append(score)
+        latencies.extend(game_latencies)
+        total_rollouts += game_rollouts
+    moves = summarise('game_moves', 'moves', latencies)
+    moves['scores'] = scores
+    throughput = {
+        'name': 'game_rollouts',
+        'unit': 'rollouts',
+        'per_sec': total_rollouts / sum(latencies),
+        'samples': len(latencies),
+    }
+    return [moves, throughput]
+
+
+def run_suite(seed=2048, positions=200, samples=30, games=2, rollouts=10, sizes=(5, 6), sized_samples=10):
+    rng = RandomStream(seed)
+    sampled = sample_positions(seed, positions)
+    results = [bench(sampled, samples, rng) for bench in MICROBENCHMARKS]
+    if sizes:
+        results.extend(bench_sized_rollouts(sizes, sized_samples, rng))
+    if games:
+        results.extend(bench_games(seed, games, rollouts))
+    return {
+        'seed': seed,
+        'config': {'positions': positions, 'samples': samples, 'games': games, 'rollouts': rollouts,
+                   'sizes': list(sizes), 'sized_samples': sized_samples},
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return (name, ratio, regressed) for every benchmark present in both reports."""
+    previous = {result['name']: result for result in baseline['results']}
+    comparison = []
+    for result in report['results']:
+        if result['name'] in previous:
+            ratio = result['per_sec'] / previous[result['name']]['per_sec']
+            comparison.append((result['name'], ratio, ratio < 1.0 - tolerance))
+    return comparison
+
+
+def print_report(report):
+    for result in report['results']:
+        line = "{:<18} {:>12.1f} {}/sec".format(result['name'], result['per_sec'], result['unit'])
+        if 'p50_us' in result:
+            line += "   p50 {:10.1f} us   p90 {:10.1f} us   p99 {:10.1f} us".format(
+                result['p50_us'], result['p90_us'], result['p99_us'])
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seed', type=int, default=2048)
+    parser.add_argument('--positions', type=int, default=200)
+    parser.add_argument('--samples', type=int, default=30)
+    parser.add_argument('--games', type=int, default=2)
+    parser.add_argument('--rollouts', type=int, default=10, help="rollouts per candidate move in macro games")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[5, 6], help="larger board sizes to roll out on")
+    parser.add_argument('--sized-samples', type=int, default=10)
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--baseline', help="compare against this JSON report")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="allowed fractional slowdown")
+    args = parser.parse_args()
+
+    report = run_suite(args.seed, args.positions, args.samples, args.games, args.rollouts, args.sizes,
+                       args.sized_samples)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressed = False
+        for name, ratio, slower in compare(report, baseline, args.tolerance):
+            print("{:<18} {:6.2f}x baseline{}".format(name, ratio, "  REGRESSION" if slower else ""))
+            regressed = regressed or slower
+        sys.exit(1 if regressed else 0)
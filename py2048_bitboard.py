@@ -0,0 +1,369 @@
+"""
+Python 2048 Game : Bitboard Move Engine
+
+Packs the 4x4 grid into a single 64-bit integer (4 bits per cell, holding the
+tile exponent, 0 for an empty cell) and performs moves with precomputed
+65536-entry row/column tables.
+
+Cell (x, y) lives in nibble 4 * y + x, so row y occupies bits 16y..16y+15 and
+the leftmost cell of a row is its lowest nibble.
+
+A nibble holds exponents up to MAX_EXPONENT (32768), so unlike Board two
+32768 tiles do not merge here, and pack_state() rejects anything larger.
+
+In pure Python the tables make a move only about twice as fast as Board, and
+possible_moves() is slightly slower than Board's early-exit check (run this
+module for the figures), so the game and the serial rollouts stay on Board.
+The packed layout pays off where it is shared: the NumPy batch simulator,
+expectimax and MCTS transposition keys, the opening book and trajectories.
+"""
+
+import random
+import time
+
+from py2048_classes import RandomStream
+
+MOVES = ('UP', 'DOWN', 'LEFT', 'RIGHT')
+
+ROW_MASK = 0xFFFF
+COL_MASK = 0x000F000F000F000F
+# A nibble can hold exponents up to 15 (32768); two such tiles never merge.
+MAX_EXPONENT = 15
+
+
+def _reverse_row(row):
+    return ((row & 0xF) << 12) | ((row & 0xF0) << 4) | ((row >> 4) & 0xF0) | (row >> 12)
+
+
+def _spread_row(row):
+    """Place the four nibbles of a row into column positions (bits 0, 16, 32, 48)."""
+    return (row & 0xF) | ((row & 0xF0) << 12) | ((row & 0xF00) << 24) | ((row & 0xF000) << 36)
+
+
+def _slide_row_left(row):
+    """Return (new_row, score_gain, merges) for moving one packed row left."""
+    line = [(row >> (4 * i)) & 0xF for i in range(4)]
+    tiles = [v for v in line if v]
+    result = []
+    score = 0
+    merges = 0
+    i = 0
+    while i < len(tiles):
+        v = tiles[i]
+        if i + 1 < len(tiles) and tiles[i + 1] == v and v < MAX_EXPONENT:
+            v += 1
+            score += 2 ** v
+            merges += 1
+            i += 2
+        else:
+            i += 1
+        result.append(v)
+    new_row = 0
+    for i, v in enumerate(result):
+        new_row |= v << (4 * i)
+    return new_row, score, merges
+
+
+def _build_tables():
+    """Return one table per direction mapping a packed line to (result << 26) | stats.
+
+    stats is (score_gain << 5) | merges.  Carries only run upwards, so adding the
+    entries of all four lines yields the summed stats in the low STATS_BITS.
+    """
+    left = [0] * 65536
+    for row in range(65536):
+        result, score, merges = _slide_row_left(row)
+        left[row] = (result << STATS_BITS) | (score << 5) | merges
+    right = [0] * 65536
+    for row in range(65536):
+        entry = left[_reverse_row(row)]
+        right[row] = (_reverse_row(entry >> STATS_BITS) << STATS_BITS) | (entry & STATS_MASK)
+    up = [(_spread_row(e >> STATS_BITS) << STATS_BITS) | (e & STATS_MASK) for e in left]
+    down = [(_spread_row(e >> STATS_BITS) << STATS_BITS) | (e & STATS_MASK) for e in right]
+    return left, right, up, down
+
+
+STATS_BITS = 26
+STATS_MASK = (1 << STATS_BITS) - 1
+ROW_LEFT, ROW_RIGHT, COL_UP, COL_DOWN = _build_tables()
+# Per packed line: bit 0 set if it can slide towards its low end (left, or up once transposed), bit 1 if
+# towards its high end.
+LINE_LEGAL = [((ROW_LEFT[row] >> STATS_BITS) != row) | (((ROW_RIGHT[row] >> STATS_BITS) != row) << 1)
+              for row in range(65536)]
+# The legal moves, in MOVES order, for each mask of UP, DOWN, LEFT and RIGHT bits.
+_LEGAL_BY_MASK = [tuple(move for bit, move in enumerate(MOVES) if mask >> bit & 1) for mask in range(16)]
+
+
+def pack_state(state):
+    """Pack an export_state() style grid (exponents or None) into a 64-bit int.
+
+    Raises ValueError for an exponent above MAX_EXPONENT, which would spill
+    into the neighbouring cell.
+    """
+    board = 0
+    for y, row in enumerate(state):
+        for x, element in enumerate(row):
+            if element:
+                if element > MAX_EXPONENT:
+                    raise ValueError("tile 2**{} does not fit a packed cell".format(element))
+                board |= element << (4 * (4 * y + x))
+    return board
+
+
+def unpack_state(board):
+    """Inverse of pack_state()."""
+    grid = []
+    for y in range(4):
+        new_row = []
+        for x in range(4):
+            v = (board >> (4 * (4 * y + x))) & 0xF
+            new_row.append(v if v else None)
+        grid.append(new_row)
+    return grid
+
+
+def transpose(board):
+    """Swap cell (x, y) with cell (y, x), turning columns into rows."""
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def move_left(board):
+    e0 = ROW_LEFT[board & ROW_MASK]
+    e1 = ROW_LEFT[(board >> 16) & ROW_MASK]
+    e2 = ROW_LEFT[(board >> 32) & ROW_MASK]
+    e3 = ROW_LEFT[board >> 48]
+    stats = (e0 + e1 + e2 + e3) & STATS_MASK
+    new = (e0 >> 26) | ((e1 >> 26) << 16) | ((e2 >> 26) << 32) | ((e3 >> 26) << 48)
+    return new, stats >> 5, stats & 31
+
+
+def move_right(board):
+    e0 = ROW_RIGHT[board & ROW_MASK]
+    e1 = ROW_RIGHT[(board >> 16) & ROW_MASK]
+    e2 = ROW_RIGHT[(board >> 32) & ROW_MASK]
+    e3 = ROW_RIGHT[board >> 48]
+    stats = (e0 + e1 + e2 + e3) & STATS_MASK
+    new = (e0 >> 26) | ((e1 >> 26) << 16) | ((e2 >> 26) << 32) | ((e3 >> 26) << 48)
+    return new, stats >> 5, stats & 31
+
+
+def move_up(board):
+    t = transpose(board)
+    e0 = COL_UP[t & ROW_MASK]
+    e1 = COL_UP[(t >> 16) & ROW_MASK]
+    e2 = COL_UP[(t >> 32) & ROW_MASK]
+    e3 = COL_UP[t >> 48]
+    stats = (e0 + e1 + e2 + e3) & STATS_MASK
+    new = (e0 >> 26) | ((e1 >> 26) << 4) | ((e2 >> 26) << 8) | ((e3 >> 26) << 12)
+    return new, stats >> 5, stats & 31
+
+
+def move_down(board):
+    t = transpose(board)
+    e0 = COL_DOWN[t & ROW_MASK]
+    e1 = COL_DOWN[(t >> 16) & ROW_MASK]
+    e2 = COL_DOWN[(t >> 32) & ROW_MASK]
+    e3 = COL_DOWN[t >> 48]
+    stats = (e0 + e1 + e2 + e3) & STATS_MASK
+    new = (e0 >> 26) | ((e1 >> 26) << 4) | ((e2 >> 26) << 8) | ((e3 >> 26) << 12)
+    return new, stats >> 5, stats & 31
+
+
+MOVE_FUNCTIONS = {'UP': move_up, 'DOWN': move_down, 'LEFT': move_left, 'RIGHT': move_right}
+
+
+def execute_move(board, move):
+    """Return (new_board, score_gain, merges) for move applied to a packed board."""
+    return MOVE_FUNCTIONS[move](board)
+
+
+def empty_cells(board):
+    """Return the nibble indices (4 * y + x) of all empty cells."""
+    return [i for i in range(16) if not (board >> (4 * i)) & 0xF]
+
+
+def spawn_tile(board, rng):
+    """Return board with one tile added to a random empty cell, as Board.add_random_tiles does.
+
+    rng is a py2048_classes.RandomStream.  A full board is returned unchanged.
+    """
+    empties = empty_cells(board)
+    if not empties:
+        return board
+    value = 2 if rng.randbelow(5) == 0 else 1
+    return board | (value << (4 * empties[rng.randbelow(len(empties))]))
+
+
+def legal_moves(board, table=LINE_LEGAL):
+    """Return the moves that change the packed board, in MOVES order.
+
+    Legality comes from LINE_LEGAL lookups on the rows and on the transposed
+    columns, without building the moved boards.
+    """
+    rows = (table[board & ROW_MASK] | table[(board >> 16) & ROW_MASK] |
+            table[(board >> 32) & ROW_MASK] | table[board >> 48])
+    t = transpose(board)
+    columns = (table[t & ROW_MASK] | table[(t >> 16) & ROW_MASK] |
+               table[(t >> 32) & ROW_MASK] | table[t >> 48])
+    return list(_LEGAL_BY_MASK[columns | rows << 2])
+
+
+class BitBoard:
+    """py2048_classes.Board's interface backed by a packed integer.
+
+    Plays like Board except at MAX_EXPONENT: two 32768 tiles stay unmerged.
+    It has no undo log, snapshot() or restore().
+    """
+
+    __slots__ = ('bits', 'score', 'merge_count', 'rng')
+
+    def __init__(self, initial_state=None, initial_score=0, initial_merge_count=0, rng=None):
+        self.bits = 0 if initial_state is None else pack_state(initial_state)
+        self.score = initial_score
+        self.merge_count = initial_merge_count
+        self.rng = RandomStream() if rng is None else rng
+
+    def __repr__(self):
+        return str("state={}, score={}, merge_count={}".format(self.export_state(), self.score, self.merge_count))
+
+    def __str__(self):
+        return self.print_metrics() + "\n" + self.print_board()
+
+    def make_move(self, move):
+        function = MOVE_FUNCTIONS.get(move)
+        if function is None:
+            return False
+        new, score, merges = function(self.bits)
+        if new == self.bits:
+            return False
+        self.bits = new
+        self.score += score
+        self.merge_count += merges
+        return True
+
+    def add_random_tiles(self, n):
+        empties = empty_cells(self.bits)
+        if not empties:
+            return False
+        rng = self.rng
+        while n > 0 and empties:
+            cell = empties.pop(rng.randbelow(len(empties)))
+            value = 2 if rng.randbelow(5) == 0 else 1
+            self.bits |= value << (4 * cell)
+            n = n - 1
+        return True
+
+    def is_empty(self, x, y):
+        return not (self.bits >> (4 * (4 * y + x))) & 0xF
+
+    def is_board_full(self):
+        return not empty_cells(self.bits)
+
+    def export_state(self):
+        return unpack_state(self.bits)
+
+    def empty(self):
+        return [(i % 4, i // 4) for i in empty_cells(self.bits)]
+
+    def possible_moves(self):
+        return legal_moves(self.bits)
+
+    def get_max_tile(self):
+        """Returns the value of the maximum tile on the board, along with its coordinates."""
+        best = 0
+        best_cell = None
+        for i in range(16):
+            v = (self.bits >> (4 * i)) & 0xF
+            if v > best:
+                best = v
+                best_cell = i
+        if best_cell is None:
+            return 0, None, None
+        return 2 ** best, best_cell // 4, best_cell % 4
+
+    def print_board(self):
+        """Create a user friendly view of the Board."""
+        cell_padding = 8
+        divider = "-" * (((cell_padding + 1) * 4) + 1)
+        lines = []
+        for row in self.export_state():
+            lines.append(divider)
+            cells = [" " * cell_padding if v is None else "{: ^{padding}}".format(2 ** v, padding=cell_padding)
+                     for v in row]
+            lines.append("|" + "|".join(cells) + "|")
+        lines.append(divider)
+        return "\n".join(lines)
+
+    def print_metrics(self):
+        """Create user friendly summary of the metrics for the board."""
+        max_tile_value, max_row_idx, max_tile_idx = self.get_max_tile()
+        return "Score:{}, Merge count:{}, Max tile:{}, Max tile coords:({},{})".format(
+            self.score, self.merge_count, max_tile_value, max_row_idx + 1, max_tile_idx + 1)
+
+
+def cross_check(games=200, seed=0):
+    """Play random games on Board and BitBoard side by side and assert they agree.
+
+    Returns the number of moves compared.
+    """
+    from py2048_classes import Board
+
+    rng = random.Random(seed)
+    checked = 0
+    for _ in range(games):
+        board = Board()
+        board.add_random_tiles(2)
+        bitboard = BitBoard(board.export_state())
+        while True:
+            moved = False
+            for move in rng.sample(MOVES, 4):
+                expected = board.make_move(move)
+                actual = bitboard.make_move(move)
+                checked += 1
+                assert expected == actual, (move, board.export_state())
+                assert board.export_state() == bitboard.export_state(), (move, board.export_state())
+                assert (board.score, board.merge_count) == (bitboard.score, bitboard.merge_count)
+                if expected:
+                    moved = True
+                    break
+            if not moved:
+                break
+            board.add_random_tiles(1)
+            bitboard.bits = pack_state(board.export_state())
+    return checked
+
+
+def _time_moves(board_class, state, repeats):
+    boards = [[board_class(state) for _ in MOVES] for _ in range(repeats)]
+    begin = time.perf_counter()
+    for row in boards:
+        for board, move in zip(row, MOVES):
+            board.make_move(move)
+    return (time.perf_counter() - begin) / (repeats * 4)
+
+
+def _time_possible_moves(board_class, state, repeats):
+    board = board_class(state)
+    begin = time.perf_counter()
+    for _ in range(repeats):
+        board.possible_moves()
+    return (time.perf_counter() - begin) / repeats
+
+
+if __name__ == "__main__":
+    from py2048_classes import Board
+
+    print("cross-checked moves:", cross_check())
+    sample = [[1, 1, 2, None], [3, None, 3, 4], [None, 2, 2, 5], [1, 2, 3, 4]]
+    for name, timer in (('make_move', _time_moves), ('possible_moves', _time_possible_moves)):
+        board_time = timer(Board, sample, 5000)
+        bitboard_time = timer(BitBoard, sample, 5000)
+        print("{:<15} Board {:8.2f} us   BitBoard {:8.2f} us   ({:.1f}x)".format(
+            name, board_time * 1e6, bitboard_time * 1e6, board_time / bitboard_time))
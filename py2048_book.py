@@ -0,0 +1,202 @@
+"""
+Python 2048 Game : Persistent Evaluation Cache and Opening Book
+
+A book file remembers search results across runs: for each position it keeps
+the best move found, the mean score still to come after it and the number of
+rollouts behind that estimate.  Positions are keyed on their
+py2048_symmetry.canonical() packed board, so the 8 orientations of a position
+share one entry, and moves are stored in the canonical orientation.
+
+The file is a HEADER followed by a fixed-capacity open-addressing hash table of
+ENTRY records, used through a memory mapping, so readers touch only the pages
+they probe.  A key lives within MAX_PROBE slots of its home slot.  When all of
+those are taken, a new entry replaces the one with the fewest samples, and only
+if it has at least as many itself, so the file never grows and weakly
+supported entries are the first to go.
+
+One process should write a given file at a time, though any number can open it
+read-only alongside; runs in parallel can keep a book each and combine them
+afterwards with merge_books():
+
+    python py2048_book.py merge combined.book run1.book run2.book
+    python py2048_book.py stats combined.book
+"""
+
+import argparse
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from py2048_bitboard import MOVES
+from py2048_symmetry import canonical, from_canonical_move, to_canonical_move
+
+FILE_MAGIC = b'2048BK01'
+HEADER = struct.Struct('<8sQQQ')
+ENTRY = struct.Struct('<QdIB3x')
+MAX_PROBE = 16
+
+MOVE_CODES = {move: code for code, move in enumerate(MOVES)}
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+BookEntry = namedtuple('BookEntry', 'move value samples')
+
+
+class OpeningBook:
+    """A memory-mapped book file; created with the given capacity (a power of two) if missing."""
+
+    def __init__(self, path, capacity=1 << 20, writable=True):
+        if capacity & (capacity - 1) or capacity < MAX_PROBE:
+            raise ValueError("capacity must be a power of two of at least {}".format(MAX_PROBE))
+        self.path = path
+        self.writable = writable
+        if not os.path.exists(path):
+            if not writable:
+                raise FileNotFoundError(path)
+            with open(path, 'wb') as book:
+                book.write(HEADER.pack(FILE_MAGIC, capacity, 0, 0))
+                book.truncate(HEADER.size + capacity * ENTRY.size)
+        self._file = open(path, 'r+b' if writable else 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        magic, self.capacity, self.count, _ = HEADER.unpack_from(self._map, 0)
+        if magic != FILE_MAGIC or len(self._map) != HEADER.size + self.capacity * ENTRY.size:
+            self.close()
+            raise ValueError("{} is not a book file".format(path))
+        self._shift = 64 - self.capacity.bit_length() + 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _slots(self, key):
+        home = ((key * _HASH_MULTIPLIER) & _MASK64) >> self._shift
+        mask = self.capacity - 1
+        return [(home + k) & mask for k in range(MAX_PROBE)]
+
+    def _read(self, slot):
+        return ENTRY.unpack_from(self._map, HEADER.size + slot * ENTRY.size)
+
+    def _write(self, slot, key, value, samples, code):
+        ENTRY.pack_into(self._map, HEADER.size + slot * ENTRY.size, key, value, samples, code)
+
+    def lookup(self, board):
+        """Return the BookEntry for a packed board (moves in its own orientation), or None."""
+        key, symmetry = canonical(board)
+        for slot in self._slots(key):
+            stored, value, samples, code = self._read(slot)
+            if stored == key:
+                return BookEntry(from_canonical_move(MOVES[code], symmetry), value, samples)
+            if not stored:
+                return None
+        return None
+
+    def record(self, board, move, value, samples):
+        """Fold a search result for a packed board into the book.
+
+        Results for the same move are pooled into a sample-weighted mean; a
+        different move replaces the stored one only if it is backed by at least
+        as many samples.
+        """
+        key, symmetry = canonical(board)
+        self.add(key, MOVE_CODES[to_canonical_move(move, symmetry)], value, samples)
+
+    def add(self, key, code, value, samples):
+        """record() for a canonical key and move code, as stored in the file."""
+        if not self.writable:
+            raise ValueError("{} was opened read-only".format(self.path))
+        weakest = None
+        for slot in self._slots(key):
+            stored, old_value, old_samples, old_code = self._read(slot)
+            if stored == key:
+                if old_code == code:
+                    total = old_samples + samples
+                    self._write(slot, key, (old_value * old_samples + value * samples) / total, total, code)
+                elif samples >= old_samples:
+                    self._write(slot, key, value, samples, code)
+                return
+            if not stored:
+                self._write(slot, key, value, samples, code)
+                self.count += 1
+                HEADER.pack_into(self._map, 0, FILE_MAGIC, self.capacity, self.count, 0)
+                return
+            if weakest is None or old_samples < weakest[1]:
+                weakest = slot, old_samples
+        # Every slot this key may use is taken: evict the least supported entry if this one beats it.
+        if samples >= weakest[1]:
+            self._write(weakest[0], key, value, samples, code)
+
+    def __iter__(self):
+        """Yield (canonical board, value, samples, move code) for every stored entry, as in ENTRY."""
+        for slot in range(self.capacity):
+            entry = self._read(slot)
+            if entry[0]:
+                yield entry
+
+    def flush(self):
+        if self.writable:
+            self._map.flush()
+
+    def close(self):
+        if not self._map.closed:
+            self.flush()
+            self._map.close()
+        self._file.close()
+
+
+def merge_books(output, inputs, capacity=None):
+    """Combine book files into output (created with capacity, default the largest input's); returns its size.
+
+    output must not exist yet: an existing book would keep its own capacity
+    and contents, so FileExistsError is raised instead.
+    """
+    if os.path.exists(output):
+        raise FileExistsError(output)
+    sources = [OpeningBook(path, writable=False) for path in inputs]
+    try:
+        capacity = capacity or max(source.capacity for source in sources)
+        with OpeningBook(output, capacity) as merged:
+            # Best-supported entries first, so eviction drops the weakest.
+            entries = sorted((entry for source in sources for entry in source), key=lambda entry: -entry[2])
+            for key, value, samples, code in entries:
+                merged.add(key, code, value, samples)
+            return len(merged)
+    finally:
+        for source in sources:
+            source.close()
+
+
+def book_stats(path):
+    with OpeningBook(path, writable=False) as book:
+        samples = [entry[2] for entry in book]
+        return {
+            'entries': len(book),
+            'capacity': book.capacity,
+            'load': len(book) / book.capacity,
+            'mean_samples': sum(samples) / len(samples) if samples else 0.0,
+            'max_samples': max(samples) if samples else 0,
+        }
+
+
+if __name__ == "__main__":
+    import json
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    merge = commands.add_parser('merge', help="combine books into a new one")
+    merge.add_argument('output')
+    merge.add_argument('inputs', nargs='+')
+    merge.add_argument('--capacity', type=int, default=None, help="power of two; default the largest input's")
+    stats = commands.add_parser('stats', help="summarise a book")
+    stats.add_argument('path')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        print(merge_books(args.output, args.inputs, args.capacity), "entries")
+    else:
+        print(json.dumps(book_stats(args.path), indent=2))
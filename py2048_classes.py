@@ -5,14 +5,104 @@ Originally written by Phil Rodgers, University of Strathclyde
 """
 
 import random
+import struct
+
+
+_GEOMETRY = {}
+
+
+def board_lines(size):
+    """Return (lines, pairs) for a size x size board, built once per size.
+
+    lines maps each move to the flat cell indices of every line, ordered from
+    the edge the tiles move towards.  pairs maps each move to the adjacent
+    (nearer, further) cell pairs along its lines; a move is legal when some
+    further tile can slide into an empty nearer cell or merge with an equal one.
+    """
+    if size not in _GEOMETRY:
+        forward = range(size)
+        backward = range(size - 1, -1, -1)
+        lines = {
+            'UP': tuple(tuple(x + size * y for y in forward) for x in forward),
+            'DOWN': tuple(tuple(x + size * y for y in backward) for x in forward),
+            'LEFT': tuple(tuple(x + size * y for x in forward) for y in forward),
+            'RIGHT': tuple(tuple(x + size * y for x in backward) for y in forward),
+        }
+        pairs = {move: tuple((line[k], line[k + 1]) for line in move_lines for k in range(size - 1))
+                 for move, move_lines in lines.items()}
+        _GEOMETRY[size] = lines, pairs
+    return _GEOMETRY[size]
+
+
+LINES, PAIRS = board_lines(4)
+
+
+class RandomStream:
+    """Seedable source of random numbers for tile spawns and rollout policies.
+
+    Draws 32-bit words from a private random.Random in blocks of BLOCK, so a
+    given seed reproduces the same game on any platform.  split() derives
+    independent child streams, e.g. one per worker process.  An antithetic
+    stream yields 0xFFFFFFFF - w for every word w of the plain stream with the
+    same seed, so its draws mirror that stream's.
+    """
+
+    BLOCK = 1024
+
+    def __init__(self, seed=None, antithetic=False):
+        self._random = random.Random(seed)
+        self._words = []
+        self.antithetic = antithetic
+
+    def _refill(self):
+        words = list(struct.unpack('<{}I'.format(self.BLOCK), self._random.randbytes(4 * self.BLOCK)))
+        if self.antithetic:
+            words = [0xFFFFFFFF - w for w in words]
+        words.reverse()
+        self._words = words
+
+    def word(self):
+        """Return a uniform 32-bit integer."""
+        if not self._words:
+            self._refill()
+        return self._words.pop()
+
+    def randbelow(self, n):
+        """Return an integer in [0, n) with a single draw."""
+        if not self._words:
+            self._refill()
+        return (self._words.pop() * n) >> 32
+
+    def random(self):
+        """Return a float in [0, 1)."""
+        if not self._words:
+            self._refill()
+        return self._words.pop() * 2.0 ** -32
+
+    def seed_value(self):
+        """Return a 64-bit integer drawn from this stream, for seeding other generators."""
+        return (self.word() << 32) | self.word()
+
+    def split(self, n):
+        """Return n child streams seeded from this one."""
+        return [RandomStream(self.seed_value()) for _ in range(n)]
+
+    def clone(self):
+        """Return an independent copy that will produce the same words as this stream."""
+        twin = RandomStream.__new__(RandomStream)
+        twin._random = random.Random()
+        twin._random.setstate(self._random.getstate())
+        twin._words = self._words[:]
+        twin.antithetic = self.antithetic
+        return twin
 
 
 class Tile:
-    _value = 0
-    _has_merged = False
+    __slots__ = ('_value', '_has_merged')
 
     def __init__(self, tile_value):
         self._value = tile_value
+        self._has_merged = False
 
     def __repr__(self):
         return str("Tile({})".format(self._value))
@@ -42,29 +132,67 @@ class Tile:
 
 
 class Board:
+    """A 2048 board, 4x4 unless another size is given.
+
+    The grid is stored as a flat list of size * size exponents in row-major
+    order, with 0 marking an empty cell.  Every size uses the same per-line
+    move code over the index tables from board_lines().  Every make_move and
+    add_random_tiles call pushes one undo log entry, which unmake() pops.
+
+    The board keeps an index of its empty cells (a list plus each cell's
+    position in it) so a tile can be spawned with one random draw; change cells
+    only through the Board methods so the index stays in step.  Random numbers
+    come from rng, a RandomStream, which is freshly seeded when not given.
+    """
 
-    def __init__(self, initial_state=None, initial_score=0, initial_merge_count=0):
-        """Initialise the Board."""
+    __slots__ = ('cells', 'score', 'merge_count', 'rng', 'size', '_lines', '_pairs', '_undo', '_empty', '_slot')
+
+    def __init__(self, initial_state=None, initial_score=0, initial_merge_count=0, rng=None, size=4):
+        """Initialise the Board; with initial_state given, its grid sets the size."""
         if initial_state == None:
-            self.grid = [
-                [None, None, None, None],
-                [None, None, None, None],
-                [None, None, None, None],
-                [None, None, None, None]
-            ]
+            self.cells = [0] * (size * size)
         else:
-            grid = []
-            for row in initial_state:
-                new_row = []
-                for element in row:
-                    if element is None:
-                        new_row.append(None)
-                    else:
-                        new_row.append(Tile(element))
-                grid.append(new_row)
-            self.grid = grid
+            size = len(initial_state)
+            self.cells = [element or 0 for row in initial_state for element in row]
+        self.size = size
+        self._lines, self._pairs = board_lines(size)
         self.score = initial_score
         self.merge_count = initial_merge_count
+        self.rng = RandomStream() if rng is None else rng
+        self._undo = []
+        self._empty = []
+        self._slot = [-1] * (size * size)
+        self._index_empty()
+
+    def _index_empty(self):
+        empty = self._empty
+        slot = self._slot
+        del empty[:]
+        for i, v in enumerate(self.cells):
+            if v:
+                slot[i] = -1
+            else:
+                slot[i] = len(empty)
+                empty.append(i)
+
+    def _add_empty(self, i):
+        self._slot[i] = len(self._empty)
+        self._empty.append(i)
+
+    def _remove_empty(self, i):
+        empty = self._empty
+        slot = self._slot
+        last = empty.pop()
+        if last != i:
+            position = slot[i]
+            empty[position] = last
+            slot[last] = position
+        slot[i] = -1
+
+    def grid_tiles(self):
+        """Return a copy of the board as rows of Tile objects (or None); writes to it do not reach the board."""
+        n = self.size
+        return [[Tile(v) if v else None for v in self.cells[i:i + n]] for i in range(0, n * n, n)]
 
     def __repr__(self):
         state = self.export_state()
@@ -78,263 +206,156 @@ class Board:
         return_string = return_string + self.print_board()
         return return_string
 
-    def add_random_tiles(self, n):
-        if self.is_board_full():
+    def snapshot(self):
+        """Capture the full state for a later restore()."""
+        return self.cells[:], self.score, self.merge_count, len(self._undo)
+
+    def restore(self, snapshot):
+        """Return to a state captured by snapshot(), copying into the existing cell buffer.
+
+        Undo entries recorded after the snapshot are discarded.
+        """
+        cells, self.score, self.merge_count, depth = snapshot
+        self.cells[:] = cells
+        del self._undo[depth:]
+        self._index_empty()
+
+    def unmake(self):
+        """Revert the most recent make_move or add_random_tiles call.
+
+        Costs time proportional to the number of cells that call changed.
+        """
+        changes, score, merges = self._undo.pop()
+        cells = self.cells
+        # changes holds (index, old value) pairs flattened; replay them backwards.
+        for k in range(len(changes) - 2, -1, -2):
+            i = changes[k]
+            old = changes[k + 1]
+            if not old:
+                if cells[i]:
+                    self._add_empty(i)
+            elif not cells[i]:
+                self._remove_empty(i)
+            cells[i] = old
+        self.score -= score
+        self.merge_count -= merges
+
+    def last_spawn(self):
+        """Return (cell index, exponent) of the last tile placed by add_random_tiles, or None.
+
+        Only meaningful straight after an add_random_tiles call.
+        """
+        if not self._undo or not self._undo[-1][0]:
+            return None
+        i = self._undo[-1][0][-2]
+        return i, self.cells[i]
+
+    def clear_undo(self):
+        """Forget all recorded actions, e.g. for a long-lived game board."""
+        del self._undo[:]
+
+    def add_random_tiles(self, n, in_order=False):
+        """Spawn n tiles on random empty cells; returns False if the board was full.
+
+        With in_order set, each draw picks among the empty cells sorted by
+        position, so boards with similar empty cells turn equal draws into the
+        same cell.
+        """
+        changes = []
+        self._undo.append((changes, 0, 0))
+        empty = self._empty
+        if not empty:
             return False
-        while n > 0:
-            x = random.randint(0, 3)
-            y = random.randint(0, 3)
-            if self.is_empty(x, y):
-                p = random.randint(1, 5)
-                if p == 1:
-                    tile = Tile(2)
-                else:
-                    tile = Tile(1)
-                self.grid[y][x] = tile
-                n = n - 1
+        rng = self.rng
+        # Sorted once per call; each spawn then drops its cell from the sorted copy.
+        ordered = sorted(empty) if in_order else None
+        while n > 0 and empty:
+            if in_order:
+                i = ordered.pop(rng.randbelow(len(ordered)))
+            else:
+                i = empty[rng.randbelow(len(empty))]
+            self._remove_empty(i)
+            changes.append(i)
+            changes.append(0)
+            # One spawn in five is a 4 (exponent 2), the rest are 2s.
+            if rng.randbelow(5) == 0:
+                self.cells[i] = 2
+            else:
+                self.cells[i] = 1
+            n = n - 1
         return True
 
     def make_move(self, move):
-        self.reset_tile_merges()
-        if move == 'UP':
-            return self.__go_up()
-        if move == 'DOWN':
-            return self.__go_down()
-        if move == 'LEFT':
-            return self.__go_left()
-        if move == 'RIGHT':
-            return self.__go_right()
-        return False
-
-    def __go_up(self):
-        moved = self.__scooch_up()
-        for x in range(4):
-            for y in range(4):
-                moved = self.__go_up_1(x, y) or moved
-        return moved
-
-    def __go_left(self):
-        moved = self.__scooch_left()
-        for y in range(4):
-            for x in range(4):
-                moved = self.__go_left_1(x, y) or moved
-        return moved
-
-    def __go_down(self):
-        moved = self.__scooch_down()
-        for x in range(4):
-            for y in [3, 2, 1, 0]:
-                moved = self.__go_down_1(x, y) or moved
-        return moved
-
-    def __go_right(self):
-        moved = self.__scooch_right()
-        for y in range(4):
-            for x in [3, 2, 1, 0]:
-                moved = self.__go_right_1(x, y) or moved
-        return moved
-
-    def __go_up_1(self, x, y):
-        moved = False
-        if y == 0:
-            return False
-        tile1 = self.grid[y][x]
-        if tile1 is not None:
-            tile2 = self.grid[y - 1][x]
-            if tile2 is None:
-                self.grid[y - 1][x] = tile1
-                self.grid[y][x] = None
-                moved = True
-            else:
-                if (not tile2.has_merged()) and tile2.get_value() == tile1.get_value():
-                    self.grid[y - 1][x] = tile1
-                    self.grid[y][x] = None
-                    tile1.inc_value()
-                    self.score += tile1.get_tile_value()
-                    self.merge_count += 1
-                    moved = True
-            if moved:
-                for i in range(y + 1, 4):
-                    self.grid[i - 1][x] = self.grid[i][x]
-                self.grid[3][x] = None
-
-        return moved
-
-    def __go_left_1(self, x, y):
-        moved = False
-        if x == 0:
+        lines = self._lines.get(move)
+        changes = []
+        score = 0
+        merges = 0
+        if lines is None:
+            self._undo.append((changes, 0, 0))
             return False
-        tile1 = self.grid[y][x]
-        if tile1 is not None:
-            tile2 = self.grid[y][x - 1]
-            if tile2 is None:
-                self.grid[y][x - 1] = tile1
-                self.grid[y][x] = None
-                moved = True
-            else:
-                if (not tile2.has_merged()) and tile2.get_value() == tile1.get_value():
-                    self.grid[y][x - 1] = tile1
-                    self.grid[y][x] = None
-                    tile1.inc_value()
-                    self.score += tile1.get_tile_value()
-                    self.merge_count += 1
-                    moved = True
-            if moved:
-                for i in range(x + 1, 4):
-                    self.grid[y][i - 1] = self.grid[y][i]
-                self.grid[y][3] = None
-
-        return moved
-
-    def __go_right_1(self, x, y):
-        moved = False
-        if x == 3:
-            return False
-        tile1 = self.grid[y][x]
-        if tile1 is not None:
-            tile2 = self.grid[y][x + 1]
-            if tile2 is None:
-                self.grid[y][x + 1] = tile1
-                self.grid[y][x] = None
-                moved = True
-            else:
-                if (not tile2.has_merged()) and tile2.get_value() == tile1.get_value():
-                    self.grid[y][x + 1] = tile1
-                    self.grid[y][x] = None
-                    tile1.inc_value()
-                    self.score += tile1.get_tile_value()
-                    self.merge_count += 1
-                    moved = True
-            if moved:
-                for i in range(x - 1, -1, -1):
-                    self.grid[y][i + 1] = self.grid[y][i]
-                self.grid[y][0] = None
-
-        return moved
-
-    def __go_down_1(self, x, y):
-        moved = False
-        if y == 3:
-            return False
-        tile1 = self.grid[y][x]
-        if tile1 is not None:
-            tile2 = self.grid[y + 1][x]
-            if tile2 is None:
-                self.grid[y + 1][x] = tile1
-                self.grid[y][x] = None
-                moved = True
-            else:
-                if (not tile2.has_merged()) and tile2.get_value() == tile1.get_value():
-                    self.grid[y + 1][x] = tile1
-                    self.grid[y][x] = None
-                    tile1.inc_value()
-                    self.score += tile1.get_tile_value()
-                    self.merge_count += 1
-                    moved = True
-            if moved:
-                for i in range(y - 1, -1, -1):
-                    self.grid[i + 1][x] = self.grid[i][x]
-                self.grid[0][x] = None
-        return moved
-
-    def __scooch_up(self):
-        moved = False
-        for x in [0, 1, 2, 3]:
-            target = -1
-            pointer = 0
-            while pointer < 4:
-                target += 1
-                if self.grid[target][x] is None:
-                    while pointer < 4 and self.grid[pointer][x] is None:
-                        pointer += 1
-                    if pointer < 4:
-                        self.grid[target][x] = self.grid[pointer][x]
-                        self.grid[pointer][x] = None
-                        moved = True
-                    pointer += 1
-                pointer = target + 1
-        return moved
-
-    def __scooch_left(self):
-        moved = False
-        for row in self.grid:
-            target = -1
-            pointer = 0
-            while pointer < 4:
-                target += 1
-                if row[target] is None:
-                    while pointer < 4 and row[pointer] is None:
-                        pointer += 1
-                    if pointer < 4:
-                        row[target] = row[pointer]
-                        row[pointer] = None
-                        moved = True
-                    pointer += 1
-                pointer = target + 1
-        return moved
-
-    def __scooch_right(self):
-        moved = False
-        for row in self.grid:
-            target = 4
-            pointer = 2
-            while pointer > 0:
-                target -= 1
-                if row[target] is None:
-                    while pointer >= 0 and row[pointer] is None:
-                        pointer -= 1
-                    if pointer >= 0:
-                        row[target] = row[pointer]
-                        row[pointer] = None
-                        moved = True
-                    pointer -= 1
-                pointer = target - 1
-        return moved
-
-    def __scooch_down(self):
-        moved = False
-        for x in [0, 1, 2, 3]:
-            target = 4
-            pointer = 2
-            while pointer > 0:
-                target -= 1
-                if self.grid[target][x] is None:
-                    while pointer >= 0 and self.grid[pointer][x] is None:
-                        pointer -= 1
-                    if pointer >= 0:
-                        self.grid[target][x] = self.grid[pointer][x]
-                        self.grid[pointer][x] = None
-                        moved = True
-                    pointer -= 1
-                pointer = target - 1
-        return moved
+        cells = self.cells
+        slot = self._slot
+        empty = self._empty
+        for line in lines:
+            target = 0
+            # Value of the last tile placed in this line, or 0 once it has merged.
+            last = 0
+            for i in line:
+                v = cells[i]
+                if not v:
+                    continue
+                if v == last:
+                    dest = line[target - 1]
+                    changes += (dest, v, i, v)
+                    v += 1
+                    score += 1 << v
+                    merges += 1
+                    last = 0
+                    slot[i] = len(empty)
+                    empty.append(i)
+                else:
+                    dest = line[target]
+                    target += 1
+                    last = v
+                    if dest == i:
+                        continue
+                    changes += (dest, 0, i, v)
+                    # dest fills and i empties: i takes over dest's index entry.
+                    position = slot[dest]
+                    empty[position] = i
+                    slot[i] = position
+                    slot[dest] = -1
+                cells[dest] = v
+                cells[i] = 0
+        self.score += score
+        self.merge_count += merges
+        self._undo.append((changes, score, merges))
+        return bool(changes)
 
     def is_empty(self, x, y):
-        return self.grid[y][x] is None
+        return not self.cells[self.size * y + x]
 
     def is_board_full(self):
-        for row in self.grid:
-            for tile in row:
-                if tile is None:
-                    return False
-        return True
+        return not self._empty
 
     def print_board(self):
         """Create a user friendly view of the Board."""
         cell_padding = 8
-        board_string = ""
-        for row in self.grid:
-            board_string = board_string + ("-" * (((cell_padding + 1) * 4) + 1)) + "\n"
-            board_string = board_string + "|"
-            for tile in row:
-                if tile is None:
-                    board_string = board_string + (" " * cell_padding) + "|"
+        n = self.size
+        divider = "-" * (((cell_padding + 1) * n) + 1)
+        parts = []
+        for i in range(0, n * n, n):
+            parts.append(divider)
+            parts.append("\n|")
+            for v in self.cells[i:i + n]:
+                if not v:
+                    parts.append(" " * cell_padding)
                 else:
-                    tile_value = tile.get_tile_value()
-                    board_string = board_string + str("{: ^{padding}}".format(tile_value, padding=cell_padding)) + "|"
-            board_string = board_string + "\n"
-        board_string = board_string + ("-" * (((cell_padding + 1) * 4) + 1))
-        return board_string
+                    parts.append("{: ^{padding}}".format(2 ** v, padding=cell_padding))
+                parts.append("|")
+            parts.append("\n")
+        parts.append(divider)
+        return "".join(parts)
 
     def print_metrics(self):
         """Create user friendly summary of the metrics for the board."""
@@ -346,92 +367,63 @@ class Board:
         return board_metrics
 
     def reset_tile_merges(self):
-        for row in self.grid:
-            for tile in row:
-                tile and tile.reset_merged()
+        """Merge tracking is local to make_move, so there is nothing to reset."""
 
     def get_max_tile(self):
         """Returns the value of the maximum tile on the board, along with its coordinates."""
-        max_tile_value = 0
-        max_row_idx = None
-        max_tile_idx = None
-        for row_idx, row in enumerate(self.grid):
-            for tile_idx, tile in enumerate(row):
-                if tile is not None:
-                    tile_value = tile.get_tile_value()
-                    if tile_value > max_tile_value:
-                        max_tile_value = tile_value
-                        max_row_idx = row_idx
-                        max_tile_idx = tile_idx
-        return max_tile_value, max_row_idx, max_tile_idx
+        top = max(self.cells)
+        if not top:
+            return 0, None, None
+        index = self.cells.index(top)
+        return 2 ** top, index // self.size, index % self.size
 
     def export_state(self):
-        grid = []
-        for row in self.grid:
-            new_row = []
-            for element in row:
-                if element is None:
-                    new_row.append(None)
-                else:
-                    new_row.append(element.get_value())
-            grid.append(new_row)
-        return grid
+        cells = self.cells
+        n = self.size
+        if n == 4:
+            return [[cells[i] or None, cells[i + 1] or None, cells[i + 2] or None, cells[i + 3] or None]
+                    for i in range(0, 16, 4)]
+        return [[v or None for v in cells[i:i + n]] for i in range(0, n * n, n)]
 
     ############################ some useful functions added by CK
 
     def empty(self):
         emptypos = []
-        for i in range(4):
-            for j in range(4):
+        for i in range(self.size):
+            for j in range(self.size):
                 if self.is_empty(i, j):
                     emptypos.append((i, j))
         return emptypos
 
+    def can_move(self, move):
+        """Check whether move would change the board, without making it."""
+        cells = self.cells
+        for near, far in self._pairs[move]:
+            v = cells[far]
+            if v and (not cells[near] or cells[near] == v):
+                return True
+        return False
+
     def possible_moves(self):
         possibilities = []
         allmoves = ['UP', 'LEFT', 'DOWN', 'RIGHT']
-        gridstate = self.export_state()
-        scores = [self.score, self.merge_count]
         for m in allmoves:
-            if self.make_move(m):
+            if self.can_move(m):
                 possibilities.append(m)
-            self.grid = []
-            for row in gridstate:
-                copy2 = []
-                for elem in row:
-                    if elem is None:
-                        copy2.append(None)
-                    else:
-                        copy2.append(Tile(elem))
-                self.grid.append(copy2)
-            self.score = scores[0]
-            self.merge_count = scores[1]
         return possibilities
 
     def random_rollout(self, rounds):
-        gridstate = self.export_state()
-        scores = [self.score, self.merge_count]
-        n = random.randint(0, len(self.possible_moves()) - 1)
+        snapshot = self.snapshot()
+        n = self.rng.randbelow(len(self.possible_moves()))
         action = self.possible_moves()[n]
         self.make_move(action)
         while not ((self.is_board_full() and self.possible_moves() == []) or rounds == 0):
             possible = self.possible_moves()
-            n = random.randint(0, len(possible) - 1)
+            n = self.rng.randbelow(len(possible))
             self.make_move(possible[n])
             self.add_random_tiles(1)
             rounds -= 1
         # retscore = self.merge_count
         retscore = self.score
-        self.grid = []
-        for row in gridstate:
-            copy2 = []
-            for elem in row:
-                if elem is None:
-                    copy2.append(None)
-                else:
-                    copy2.append(Tile(elem))
-            self.grid.append(copy2)
-        self.score = scores[0]
-        self.merge_count = scores[1]
+        self.restore(snapshot)
         return retscore
-
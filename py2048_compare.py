@@ -0,0 +1,242 @@
+"""
+Python 2048 Game : Paired A/B Comparison With Sequential Stopping
+
+Plays two agent configurations against each other on paired seeds: both games
+of a pair use the same seed, so both agents face the same stream of tile
+spawns.  After every finished pair the score difference (B minus A) updates a
+sequential test, and the run stops as soon as the test decides:
+
+    'A' or 'B'     that agent scores higher by at least threshold points
+    'equivalent'   the difference is smaller than threshold either way
+    None           max_pairs ran out first
+
+Two tests are available.  'sprt' (the default) runs two sequential
+probability ratio tests on the mean difference, one for each direction, each
+pitting a difference of 0 against one of threshold, with the normal
+approximation and the variance estimated from the pairs so far; alpha and
+beta are the error rates of each.  'ci' stops once a z-interval of the mean
+difference excludes 0 or lies within (-threshold, threshold); it is simpler
+to read but, checked after every pair, errs more often than its nominal
+level.
+
+Agents are given as 'name' or 'name:key=value,...', with name one of
+py2048_tournament.AGENTS and the keys MatthewStarkey2048.main() settings
+(plus weights for ntuple):
+
+    python py2048_compare.py montecarlo:rollouts=20 montecarlo:rollouts=20,confidence=2 --threshold 500
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import sys
+from statistics import NormalDist
+
+from py2048_instrument import RunningStats
+from py2048_tournament import AGENTS, game_seeds, play_seeded_game
+
+SETTINGS = ('time_limit', 'rollouts', 'confidence', 'max_plies', 'full_every', 'batch_size', 'crn', 'antithetic',
+            'book', 'book_depth', 'book_samples', 'weights')
+METHODS = ('sprt', 'ci')
+# Pairs played before any decision, so the variance estimate means something.
+MIN_PAIRS = 16
+
+
+def parse_agent(spec):
+    """Split 'name:key=value,...' into (name, settings dict); values are read as JSON where they parse."""
+    name, _, options = spec.partition(':')
+    if name not in AGENTS:
+        raise ValueError("unknown agent {!r}; expected one of {}".format(name, ', '.join(AGENTS)))
+    settings = {}
+    for option in filter(None, options.split(',')):
+        key, equals, value = option.partition('=')
+        if not equals or key not in SETTINGS:
+            raise ValueError("bad agent setting {!r}; expected key=value with key one of {}".format(
+                option, ', '.join(SETTINGS)))
+        try:
+            settings[key] = json.loads(value)
+        except ValueError:
+            settings[key] = value
+    return name, settings
+
+
+def play_side(task):
+    """Pool entry point: play one side of a pair and return its results record."""
+    pair, seed, side, spec = task
+    name, settings = parse_agent(spec)
+    weights = settings.pop('weights', 'weights.ntn')
+    book_path = settings.pop('book', None)
+    record = play_seeded_game(name, seed, weights, book_path, **settings)
+    record.update(pair=pair, side=side, agent=spec)
+    return record
+
+
+class PairedSPRT:
+    """Two one-sided SPRTs on the mean paired difference, normal approximation."""
+
+    def __init__(self, threshold, alpha=0.05, beta=0.05, min_pairs=MIN_PAIRS):
+        self.threshold = threshold
+        self.min_pairs = min_pairs
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.differences = RunningStats()
+
+    def add(self, difference):
+        self.differences.add(difference)
+
+    def llr(self, delta):
+        """Log likelihood ratio of a mean difference of delta against one of 0."""
+        stats = self.differences
+        variance = stats.variance()
+        if not variance:
+            return 0.0
+        return stats.count * delta * (stats.mean - delta / 2) / variance
+
+    def decision(self):
+        if self.differences.count < self.min_pairs:
+            return None
+        b_better = self.llr(self.threshold)
+        a_better = self.llr(-self.threshold)
+        if b_better >= self.upper:
+            return 'B'
+        if a_better >= self.upper:
+            return 'A'
+        if b_better <= self.lower and a_better <= self.lower:
+            return 'equivalent'
+        return None
+
+    def as_dict(self):
+        return {'method': 'sprt', 'llr_b': self.llr(self.threshold), 'llr_a': self.llr(-self.threshold),
+                'bounds': (self.lower, self.upper)}
+
+
+class PairedInterval:
+    """Running z-interval on the mean paired difference."""
+
+    def __init__(self, threshold, z=1.96, min_pairs=MIN_PAIRS):
+        self.threshold = threshold
+        self.z = z
+        self.min_pairs = min_pairs
+        self.differences = RunningStats()
+
+    def add(self, difference):
+        self.differences.add(difference)
+
+    def interval(self):
+        stats = self.differences
+        if stats.count < 2:
+            return -math.inf, math.inf
+        half = self.z * math.sqrt(stats.variance() / stats.count)
+        return stats.mean - half, stats.mean + half
+
+    def decision(self):
+        if self.differences.count < self.min_pairs:
+            return None
+        low, high = self.interval()
+        if low > 0:
+            return 'B'
+        if high < 0:
+            return 'A'
+        if -self.threshold < low and high < self.threshold:
+            return 'equivalent'
+        return None
+
+    def as_dict(self):
+        return {'method': 'ci', 'interval': self.interval()}
+
+
+def make_test(method, threshold, alpha=0.05, beta=0.05):
+    """Build the sequential test for method, 'sprt' or 'ci' (a two-sided 1 - alpha interval)."""
+    if method == 'sprt':
+        return PairedSPRT(threshold, alpha, beta)
+    if method == 'ci':
+        return PairedInterval(threshold, z=NormalDist().inv_cdf(1 - alpha / 2))
+    raise ValueError("unknown method {!r}; expected one of {}".format(method, ', '.join(METHODS)))
+
+
+def run_comparison(a, b, max_pairs=200, workers=None, seed=0, method='sprt', threshold=1000.0, alpha=0.05,
+                   beta=0.05, results=None, on_pair=None):
+    """Play paired games of agent specs a and b until the sequential test decides; returns a report dict.
+
+    Pairs are fed to the test in seed order, whatever order the pool finishes
+    them in, and games still running when it decides are abandoned.  results
+    is an optional ResultsWriter for every game record; on_pair is called with
+    (pair, record_a, record_b, test) after every pair.
+    """
+    parse_agent(a)
+    parse_agent(b)
+    test = make_test(method, threshold, alpha, beta)
+    scores = {'A': RunningStats(), 'B': RunningStats()}
+    products = 0.0
+    decision = None
+    tasks = [(pair, pair_seed, side, spec)
+             for pair, pair_seed in enumerate(game_seeds(seed, max_pairs))
+             for side, spec in (('A', a), ('B', b))]
+    with multiprocessing.Pool(workers) as pool:
+        records = pool.imap(play_side, tasks)
+        for pair in range(max_pairs):
+            record_a = next(records)
+            record_b = next(records)
+            for record in (record_a, record_b):
+                scores[record['side']].add(record['score'])
+                if results is not None:
+                    results.write(record)
+            products += record_a['score'] * record_b['score']
+            test.add(record_b['score'] - record_a['score'])
+            if on_pair is not None:
+                on_pair(pair, record_a, record_b, test)
+            decision = test.decision()
+            if decision is not None:
+                break
+    pairs = test.differences.count
+    report = {
+        'a': a,
+        'b': b,
+        'decision': decision,
+        'pairs': pairs,
+        'threshold': threshold,
+        'mean_a': scores['A'].mean,
+        'mean_b': scores['B'].mean,
+        'mean_difference': test.differences.mean,
+        'difference_sd': math.sqrt(test.differences.variance()),
+        'seed': seed,
+    }
+    # How much pairing helped: the correlation of the two scores within a pair.
+    if pairs > 1 and scores['A'].variance() and scores['B'].variance():
+        covariance = (products - pairs * scores['A'].mean * scores['B'].mean) / (pairs - 1)
+        report['score_correlation'] = covariance / math.sqrt(scores['A'].variance() * scores['B'].variance())
+    report.update(test.as_dict())
+    return report
+
+
+if __name__ == "__main__":
+    from py2048_results import ResultsWriter
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('a', help="baseline agent, 'name' or 'name:key=value,...'")
+    parser.add_argument('b', help="candidate agent, in the same form")
+    parser.add_argument('--threshold', type=float, default=1000.0,
+                        help="smallest score difference worth detecting")
+    parser.add_argument('--method', choices=METHODS, default='sprt')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05, help="miss rate for the sprt method")
+    parser.add_argument('--max-pairs', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=None, help="default: one per CPU")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', help="append every game record to this JSONL file")
+    args = parser.parse_args()
+
+    def progress(pair, record_a, record_b, test):
+        stats = test.differences
+        print("pair {:>4}  A {:>7}  B {:>7}  mean difference {:9.1f} (sd {:.1f})".format(
+            pair, record_a['score'], record_b['score'], stats.mean, math.sqrt(stats.variance())), file=sys.stderr)
+
+    writer = ResultsWriter(args.results) if args.results else None
+    try:
+        report = run_comparison(args.a, args.b, args.max_pairs, args.workers, args.seed, args.method,
+                                args.threshold, args.alpha, args.beta, writer, progress)
+    finally:
+        if writer is not None:
+            writer.close()
+    print(json.dumps(report, indent=2))
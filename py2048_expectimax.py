@@ -0,0 +1,125 @@
+"""
+Python 2048 Game : Expectimax Search Agent
+
+Searches packed boards (py2048_bitboard layout) with max nodes over the four
+moves and chance nodes over every empty cell, spawning exponent 1 with
+probability 0.8 and exponent 2 with probability 0.2 as Board.add_random_tiles
+does.  Leaves are scored with py2048_heuristic.evaluate().
+
+Chance-node values are kept in a transposition table with a hard entry cap and
+least-recently-used eviction, so it can live for a whole game without growing.
+With symmetric set the table is keyed on py2048_symmetry.canonical() boards,
+so a position reached in any of its 8 orientations shares one entry.  Within a
+single game's searches mirrored positions are rare, so this is off by default.
+"""
+
+from collections import OrderedDict
+
+from py2048_bitboard import MOVES, MOVE_FUNCTIONS, pack_state
+from py2048_heuristic import evaluate
+from py2048_symmetry import canonical
+
+SPAWNS = ((1, 0.8), (2, 0.2))
+
+
+class TranspositionTable:
+    """Map (board -> (depth, value)) with at most max_entries entries, evicting the least recently used."""
+
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, board, depth):
+        """Return a stored value searched at least depth plies deep, or None."""
+        entry = self.entries.get(board)
+        if entry is None or entry[0] < depth:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(board)
+        self.hits += 1
+        return entry[1]
+
+    def store(self, board, depth, value):
+        self.entries[board] = (depth, value)
+        self.entries.move_to_end(board)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+def search_depth(empties, max_depth=3):
+    """Fewer empty cells mean fewer chance branches, so search deeper."""
+    if empties >= 8:
+        depth = 1
+    elif empties >= 4:
+        depth = 2
+    else:
+        depth = 3
+    return min(depth, max_depth)
+
+
+class ExpectimaxAgent:
+    """Choose moves by depth-limited expectimax over packed boards."""
+
+    def __init__(self, max_depth=3, table_size=200000, min_probability=1e-4, symmetric=False):
+        self.max_depth = max_depth
+        self.symmetric = symmetric
+        self.min_probability = min_probability
+        self.table = TranspositionTable(table_size)
+
+    def choose_move(self, board):
+        """Return the best move for a Board (or anything with export_state()), or None if stuck."""
+        return self.best_move(pack_state(board.export_state()))[0]
+
+    def best_move(self, packed):
+        """Return (move, value) for a packed board; move is None when no move is legal."""
+        empties = sum(1 for i in range(16) if not (packed >> (4 * i)) & 0xF)
+        depth = search_depth(empties, self.max_depth)
+        best = None
+        best_value = float('-inf')
+        for move in MOVES:
+            new = MOVE_FUNCTIONS[move](packed)[0]
+            if new == packed:
+                continue
+            value = self._chance(new, depth, 1.0)
+            if value > best_value:
+                best_value = value
+                best = move
+        return best, best_value
+
+    def _max(self, board, depth, probability):
+        best = None
+        for function in MOVE_FUNCTIONS.values():
+            new = function(board)[0]
+            if new != board:
+                value = self._chance(new, depth, probability)
+                if best is None or value > best:
+                    best = value
+        # A dead board scores nothing.
+        return 0.0 if best is None else best
+
+    def _chance(self, board, depth, probability):
+        if depth == 0 or probability < self.min_probability:
+            return evaluate(board)
+        key = canonical(board)[0] if self.symmetric else board
+        cached = self.table.lookup(key, depth)
+        if cached is not None:
+            return cached
+        empties = [4 * i for i in range(16) if not (board >> (4 * i)) & 0xF]
+        if not empties:
+            return evaluate(board)
+        probability /= len(empties)
+        total = 0.0
+        for shift in empties:
+            for value, chance in SPAWNS:
+                total += chance * self._max(board | (value << shift), depth - 1, probability * chance)
+        result = total / len(empties)
+        self.table.store(key, depth, result)
+        return result
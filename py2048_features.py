@@ -0,0 +1,221 @@
+"""
+Python 2048 Game : Vectorized Static Board Evaluator
+
+Scores whole batches of positions at once with NumPy.  States are exponent
+arrays of shape (N, n, n) (0 for empty), or packed uint64 boards of shape (N,)
+in the py2048_bitboard layout, and every feature is computed for the batch
+with array operations on its rows and columns (for packed boards, by lookup in
+a table of every 16-bit line):
+
+    empty          empty cells
+    monotonicity   per line, the smaller of its rises and its falls in
+                   exponent, summed over rows and columns (0 when every line
+                   is sorted)
+    smoothness     exponent differences between neighbouring tiles
+    merges         pairs of equal tiles that would slide together
+    corner         exponents weighted by distance from the best corner, 1 at
+                   the corner falling to 0 at the opposite one
+    max_placement  1 when the largest tile is in a corner, 0.5 on an edge
+
+evaluate_batch() returns bias plus the weighted sum of the features.
+DEFAULT_FEATURE_WEIGHTS ranks positions for search; LEAF_FEATURE_WEIGHTS were
+fitted with fit_weights() to the score random rollouts still make from a
+position, so leaf_values() can stand in for the rest of a truncated rollout
+(see py2048_batch.batched_rollouts):
+
+    python py2048_features.py --fit --positions 5000 --samples 64
+
+Requires NumPy.
+"""
+
+import argparse
+import functools
+import json
+import time
+
+import numpy as np
+
+from py2048_heuristic import LEAF_WEIGHTS
+
+FEATURES = ('empty', 'monotonicity', 'smoothness', 'merges', 'corner', 'max_placement')
+
+DEFAULT_FEATURE_WEIGHTS = {
+    'bias': 0.0,
+    'empty': 2.7,
+    'monotonicity': -1.0,
+    'smoothness': -0.1,
+    'merges': 1.0,
+    'corner': 1.0,
+    'max_placement': 1.0,
+}
+
+# Fitted by fit_weights() to random-rollout outcomes; shared with the serial
+# py2048_heuristic.leaf_value() so both value a cut-off rollout alike.
+LEAF_FEATURE_WEIGHTS = LEAF_WEIGHTS
+
+
+@functools.lru_cache(maxsize=None)
+def _geometry(n):
+    """Corner gradients (4, n, n) and the corner and edge cell masks for an n x n board."""
+    y, x = np.mgrid[0:n, 0:n]
+    span = 2 * n - 2
+    gradient = (span - y - x) / span
+    gradients = np.stack([gradient, gradient[:, ::-1], gradient[::-1, :], gradient[::-1, ::-1]])
+    edge = (y == 0) | (y == n - 1) | (x == 0) | (x == n - 1)
+    corner = ((y == 0) | (y == n - 1)) & ((x == 0) | (x == n - 1))
+    return gradients, corner, edge & ~corner
+
+
+def _line_features(lines):
+    """(empty, monotonicity, smoothness, merges) of an (N, L, n) array of lines, summed over the L lines."""
+    n = lines.shape[2]
+    occupied = lines > 0
+
+    empty = (~occupied).sum(axis=(1, 2))
+
+    steps = lines[:, :, 1:] - lines[:, :, :-1]
+    rises = np.clip(steps, 0, None).sum(axis=2)
+    falls = np.clip(-steps, 0, None).sum(axis=2)
+    monotonicity = np.minimum(rises, falls).sum(axis=1)
+
+    neighbours = occupied[:, :, 1:] & occupied[:, :, :-1]
+    smoothness = (np.abs(steps) * neighbours).sum(axis=(1, 2))
+
+    # Equal tiles d cells apart merge if every cell between them is empty.
+    seen = np.cumsum(occupied, axis=2)
+    merges = np.zeros(len(lines), dtype=np.int64)
+    for d in range(1, n):
+        between = seen[:, :, d - 1:n - 1] - seen[:, :, :n - d]
+        pairs = (lines[:, :, :n - d] == lines[:, :, d:]) & occupied[:, :, d:] & (between == 0)
+        merges += pairs.sum(axis=(1, 2))
+
+    return np.stack([empty, monotonicity, smoothness, merges], axis=1).astype(np.float64)
+
+
+@functools.lru_cache(maxsize=None)
+def _line_table():
+    """_line_features() of every packed 16-bit line, indexed by the line."""
+    lines = (np.arange(65536)[:, None] >> np.arange(0, 16, 4)) & 0xF
+    return _line_features(lines[:, None, :].astype(np.int16))
+
+
+def _cell_features(cells, n):
+    """(corner, max_placement) of an (N, n * n) array of exponents."""
+    gradients, corner_cells, edge_cells = _geometry(n)
+    corner = (cells @ gradients.reshape(4, -1).T).max(axis=1)
+    top = cells.max(axis=1)
+    at_max = (cells == top[:, None]) & (top[:, None] > 0)
+    max_placement = np.where((at_max & corner_cells.ravel()).any(axis=1), 1.0,
+                             np.where((at_max & edge_cells.ravel()).any(axis=1), 0.5, 0.0))
+    return np.stack([corner, max_placement], axis=1)
+
+
+def feature_matrix(states):
+    """Return an (N, len(FEATURES)) array of the features of every state, in FEATURES order.
+
+    Packed boards take their line features from a table of every 16-bit line,
+    as py2048_heuristic does; exponent arrays of any size are computed directly.
+    """
+    states = np.asarray(states)
+    if states.ndim == 1:
+        from py2048_batch import transpose, unpack_states
+        boards = states.astype(np.uint64)
+        shifts = np.array([0, 16, 32, 48], dtype=np.uint64)
+        rows = (boards[:, None] >> shifts) & np.uint64(0xFFFF)
+        columns = (transpose(boards)[:, None] >> shifts) & np.uint64(0xFFFF)
+        table = _line_table()
+        lines = table[rows.astype(np.intp)].sum(axis=1) + table[columns.astype(np.intp)].sum(axis=1)
+        # Every cell lies on one row and one column, so empty cells were counted twice.
+        lines[:, 0] /= 2
+        cells = unpack_states(boards).reshape(len(boards), 16).astype(np.int16)
+        return np.hstack([lines, _cell_features(cells, 4)])
+    if states.ndim != 3 or states.shape[1] != states.shape[2]:
+        raise ValueError("states must be packed boards (N,) or exponents (N, n, n)")
+    x = states.astype(np.int16)
+    n = x.shape[1]
+    # Rows and columns together, each as a line of n cells.
+    lines = _line_features(np.concatenate([x, x.transpose(0, 2, 1)], axis=1))
+    lines[:, 0] /= 2
+    return np.hstack([lines, _cell_features(x.reshape(len(x), n * n), n)])
+
+
+def _weight_vector(weights):
+    unknown = set(weights) - set(FEATURES) - {'bias'}
+    if unknown:
+        raise ValueError("unknown feature weights: {}".format(', '.join(sorted(unknown))))
+    return np.array([weights.get(name, 0.0) for name in FEATURES]), weights.get('bias', 0.0)
+
+
+def evaluate_batch(states, weights=DEFAULT_FEATURE_WEIGHTS):
+    """Static value of every state: bias plus the weighted features (missing weights count as 0)."""
+    vector, bias = _weight_vector(weights)
+    return feature_matrix(states) @ vector + bias
+
+
+def leaf_values(states, weights=LEAF_FEATURE_WEIGHTS):
+    """Estimated score random play still makes from every state, for valuing truncated rollouts."""
+    return evaluate_batch(states, weights)
+
+
+def fit_weights(states, targets):
+    """Least-squares weights (with bias) mapping the features of states to targets."""
+    features = feature_matrix(states)
+    design = np.hstack([features, np.ones((len(features), 1))])
+    solution = np.linalg.lstsq(design, np.asarray(targets, dtype=np.float64), rcond=None)[0]
+    weights = {name: float(w) for name, w in zip(FEATURES, solution)}
+    weights['bias'] = float(solution[-1])
+    return weights
+
+
+def rollout_targets(positions, samples, rng):
+    """Mean score still to come under random play from each (state, score, merge_count) position."""
+    from py2048_batch import MOVE_INDEX, batched_rollouts
+    from py2048_bitboard import legal_moves, pack_state
+
+    boards, firsts, owners = [], [], []
+    for k, (state, score, merge_count) in enumerate(positions):
+        board = pack_state(state)
+        posses = legal_moves(board)
+        # Spread the samples over the legal first moves, as random play would choose them.
+        for s in range(samples):
+            boards.append(board)
+            firsts.append(MOVE_INDEX[posses[s % len(posses)]])
+            owners.append(k)
+    finals, _ = batched_rollouts(np.array(boards, dtype=np.uint64), np.array(firsts), 0, 0, rng)
+    totals = np.bincount(owners, weights=finals, minlength=len(positions))
+    return totals / samples
+
+
+if __name__ == "__main__":
+    from py2048_benchmark import sample_positions
+    from py2048_bitboard import pack_state
+    from py2048_heuristic import evaluate
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--positions', type=int, default=2000)
+    parser.add_argument('--samples', type=int, default=16, help="rollouts per position when fitting")
+    parser.add_argument('--seed', type=int, default=2048)
+    parser.add_argument('--fit', action='store_true', help="fit leaf weights and print them as JSON")
+    args = parser.parse_args()
+
+    positions = sample_positions(args.seed, args.positions)
+    packed = [pack_state(state) for state, _, _ in positions]
+    boards = np.array(packed, dtype=np.uint64)
+    evaluate_batch(boards[:1])
+    begin = time.perf_counter()
+    evaluate_batch(boards)
+    batch_seconds = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for board in packed:
+        evaluate(board)
+    table_seconds = time.perf_counter() - begin
+    print("evaluate_batch: {:.0f} states/s, py2048_heuristic.evaluate: {:.0f} states/s".format(
+        len(boards) / batch_seconds, len(boards) / table_seconds))
+
+    if args.fit:
+        targets = rollout_targets(positions, args.samples, np.random.default_rng(args.seed))
+        weights = fit_weights(boards, targets)
+        residual = targets - evaluate_batch(boards, weights)
+        print("rms error {:.1f} against a target spread of {:.1f}".format(
+            float(np.sqrt(np.mean(residual ** 2))), float(np.std(targets))))
+        print(json.dumps(weights, indent=4))
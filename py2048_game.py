@@ -4,7 +4,12 @@ Python 2048 Game : Basic Console Based User Interface For Game Play
 Originally written by Phil Rodgers, University of Strathclyde
 """
 
+import argparse
+import os
+import sys
+
 from py2048_classes import Board
+from py2048_render import AnsiRenderer, TextRenderer
 
 
 def getchar():
@@ -29,21 +34,45 @@ def getchar():
         return answer
 
 
-def main():
-    board = Board()
+def main(trajectory=None, size=4, renderer=None, hints=False):
+    """Play interactively on a size x size board.
+
+    trajectory is an optional py2048_trajectory.TrajectoryWriter (4x4 only).
+    renderer is a py2048_render renderer, a TextRenderer by default.
+    With hints set, a py2048_ponder.Ponderer searches while the game waits for
+    a key; h shows its suggested move and g plays it.
+    """
+    if trajectory is not None and size != 4:
+        raise ValueError("trajectories record 4x4 boards")
+    board = Board(size=size)
     board.add_random_tiles(2)
-    print("main code")
+    renderer = TextRenderer() if renderer is None else renderer
+    renderer.message("main code")
+    if trajectory is not None:
+        trajectory.start_game()
+    ponderer = None
+    if hints:
+        from py2048_ponder import Ponderer
+        ponderer = Ponderer()
 
     move_counter = 0
     move = None
     move_result = False
     
     while True:
-        print("Number of successful moves:{}, Last move attempted:{}:, Move status:{}".format(move_counter, move, move_result))
-        print(board)
+        renderer.frame(board, "Number of successful moves:{}, Last move attempted:{}:, Move status:{}".format(
+            move_counter, move, move_result))
+        if ponderer is not None:
+            ponderer.start(board)
         key = getchar()
+        if ponderer is not None:
+            ponderer.stop()
 
         if key == b'q' or key == 'q':
+            if trajectory is not None:
+                trajectory.end_game(board.export_state(), board.score)
+                trajectory.close()
+            renderer.close()
             quit()
 
         if key == b'w' or key == 'w':
@@ -54,14 +83,36 @@ def main():
             move = 'DOWN'
         elif key == b'd' or key == 'd':
             move = 'RIGHT'
+        elif ponderer is not None and key in (b'h', 'h', b'g', 'g'):
+            move, value, rollouts = ponderer.best(board)
+            if move is None:
+                renderer.message("Hint: no moves left")
+            elif value is None:
+                renderer.message("Hint: {} (not searched yet)".format(move))
+            else:
+                renderer.message("Hint: {} (about {:.0f} more points, {} rollouts per move)".format(
+                    move, value, rollouts))
+            if key == b'h' or key == 'h':
+                move = None
         else:
             move = None
 
         if move is not None:
+            gridstate = board.export_state()
+            score_before = board.score
             move_result = board.make_move(move)
             if move_result:
                 add_tile_result = board.add_random_tiles(1)
+                if trajectory is not None:
+                    trajectory.record(gridstate, move, board.last_spawn(), score_before)
                 move_counter = move_counter + 1
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=4)
+    parser.add_argument('--hints', action='store_true',
+                        help="search in the background; h shows the suggested move, g plays it")
+    args = parser.parse_args()
+    # Redraw in place on a POSIX terminal; fall back to plain printing elsewhere.
+    main(size=args.size, renderer=AnsiRenderer() if sys.stdout.isatty() and os.name != 'nt' else None,
+         hints=args.hints)
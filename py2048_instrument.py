@@ -0,0 +1,203 @@
+"""
+Python 2048 Game : Hot-Path Instrumentation
+
+Collects per-move profiles of the AI loop: rollouts per candidate move, the
+mean and variance of rollout length and score, call counts and time spent in
+the Board primitives, and (every few moves) allocation figures from
+tracemalloc.  Each move produces one plain dict record passed to a sink.
+
+Timing wrappers are installed on Board only while an Instrumentation is open,
+so the loop runs untouched when instrumentation is off:
+
+    with Instrumentation(sink=records.append, allocation_every=10) as instrument:
+        MatthewStarkey2048.main(instrument=instrument)
+"""
+
+import time
+import tracemalloc
+
+from py2048_classes import Board
+
+PRIMITIVES = ('make_move', 'add_random_tiles', 'possible_moves', 'export_state')
+
+_originals = {}
+_active = None
+
+
+class RunningStats:
+    """Count, mean and variance accumulated with Welford's method; mergeable across workers."""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def as_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'variance': self.variance()}
+
+
+class MoveProfile:
+    """Counters for one move's search; picklable so pool workers can send theirs back."""
+
+    def __init__(self):
+        self.lengths = {}
+        self.scores = {}
+        self.primitives = {name: [0, 0.0] for name in PRIMITIVES}
+
+    def record_rollout(self, move, length, score):
+        if move not in self.lengths:
+            self.lengths[move] = RunningStats()
+            self.scores[move] = RunningStats()
+        self.lengths[move].add(length)
+        self.scores[move].add(score)
+
+    def merge(self, other):
+        for move, stats in other.lengths.items():
+            if move not in self.lengths:
+                self.lengths[move] = RunningStats()
+                self.scores[move] = RunningStats()
+            self.lengths[move].merge(stats)
+            self.scores[move].merge(other.scores[move])
+        for name, (calls, seconds) in other.primitives.items():
+            self.primitives[name][0] += calls
+            self.primitives[name][1] += seconds
+
+
+def _timed(name, function):
+    def wrapper(*args, **kwargs):
+        profile = _active
+        if profile is None:
+            return function(*args, **kwargs)
+        begin = time.perf_counter()
+        result = function(*args, **kwargs)
+        counters = profile.primitives[name]
+        counters[0] += 1
+        counters[1] += time.perf_counter() - begin
+        return result
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def install():
+    """Wrap the Board primitives with timers (idempotent)."""
+    if _originals:
+        return
+    for name in PRIMITIVES:
+        _originals[name] = getattr(Board, name)
+        setattr(Board, name, _timed(name, _originals[name]))
+
+
+def uninstall():
+    """Put the original Board primitives back."""
+    for name, function in _originals.items():
+        setattr(Board, name, function)
+    _originals.clear()
+
+
+def begin_worker():
+    """Start a fresh profile in this process for one search job; returns (profile, previous)."""
+    global _active
+    install()
+    previous = _active
+    _active = MoveProfile()
+    return _active, previous
+
+
+def end_worker(previous):
+    """Make previous the active profile again after a search job.
+
+    With no earlier profile, as in a pool worker, the timers come off again so
+    later uninstrumented jobs in the same process run untouched.
+    """
+    global _active
+    _active = previous
+    if previous is None:
+        uninstall()
+
+
+class Instrumentation:
+    """Per-move profiler for the AI loop that emits one record per move to sink."""
+
+    def __init__(self, sink=None, allocation_every=0, top_allocations=3):
+        self.records = []
+        self.sink = self.records.append if sink is None else sink
+        self.allocation_every = allocation_every
+        self.top_allocations = top_allocations
+        self.profile = None
+        self._moves = 0
+        self._tracing = False
+
+    def __enter__(self):
+        install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        global _active
+        _active = None
+        uninstall()
+
+    def start_move(self):
+        global _active
+        install()
+        self.profile = MoveProfile()
+        _active = self.profile
+        self._tracing = bool(self.allocation_every) and self._moves % self.allocation_every == 0
+        if self._tracing:
+            tracemalloc.start()
+
+    def merge(self, profile):
+        """Fold a profile returned by a search worker into the current move."""
+        if profile is not None and profile is not self.profile:
+            self.profile.merge(profile)
+
+    def finish_move(self, move_number, move, latency, **fields):
+        global _active
+        _active = None
+        profile = self.profile
+        record = {
+            'move_number': move_number,
+            'move': move,
+            'latency': latency,
+            'rollouts': {m: stats.count for m, stats in profile.lengths.items()},
+            'rollout_length': {m: stats.as_dict() for m, stats in profile.lengths.items()},
+            'rollout_score': {m: stats.as_dict() for m, stats in profile.scores.items()},
+            'primitives': {name: {'calls': calls, 'seconds': seconds}
+                           for name, (calls, seconds) in profile.primitives.items()},
+        }
+        if self._tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            record['allocations'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top': [str(stat) for stat in snapshot.statistics('lineno')[:self.top_allocations]],
+            }
+        record.update(fields)
+        self._moves += 1
+        self.sink(record)
+        return record
@@ -0,0 +1,190 @@
+"""
+Python 2048 Game : UCT Monte Carlo Tree Search Agent
+
+Builds a tree of decision nodes (the player picks a move) and chance nodes (the
+game spawns a tile) over packed boards in the py2048_bitboard layout.  Decision
+nodes choose among their moves with UCB1; chance nodes sample a spawn and keep
+one child per resulting board.  Leaves are valued by random-policy playouts.
+
+Values are score gained from a node onwards, so after the real move and spawn
+the matching subtree is kept as the next root with its statistics intact.  The
+tree is capped at max_nodes; when it grows past that, rarely visited subtrees
+are pruned.
+"""
+
+import math
+import time
+
+from py2048_bitboard import MOVE_FUNCTIONS, legal_moves, pack_state, spawn_tile
+from py2048_classes import RandomStream
+
+
+class DecisionNode:
+    __slots__ = ('board', 'visits', 'total', 'children', 'untried')
+
+    def __init__(self, board):
+        self.board = board
+        self.visits = 0
+        self.total = 0.0
+        self.children = {}
+        self.untried = legal_moves(board)
+
+
+class ChanceNode:
+    __slots__ = ('board', 'gain', 'visits', 'total', 'children')
+
+    def __init__(self, board, gain):
+        self.board = board
+        self.gain = gain
+        self.visits = 0
+        self.total = 0.0
+        self.children = {}
+
+
+def count_nodes(node):
+    """Number of nodes in the subtree rooted at node."""
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children.values())
+    return count
+
+
+def random_playout(board, rng):
+    """Play random legal moves from a packed board until the game ends; return the score gained."""
+    functions = tuple(MOVE_FUNCTIONS.values())
+    total = 0
+    while True:
+        outcomes = [outcome for outcome in (function(board) for function in functions) if outcome[0] != board]
+        if not outcomes:
+            return total
+        new, gain, _ = outcomes[rng.randbelow(len(outcomes))]
+        total += gain
+        board = spawn_tile(new, rng)
+
+
+class MCTSAgent:
+    """Choose moves by UCT search, reusing the subtree of the position actually reached."""
+
+    def __init__(self, time_limit=2.95, iterations=None, exploration=1.0, max_nodes=200000, rng=None):
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.exploration = exploration
+        self.max_nodes = max_nodes
+        self.rng = RandomStream() if rng is None else rng
+        self.node_count = 0
+        self._last = None
+
+    def choose_move(self, board):
+        """Return the best move for a Board (or anything with export_state()), or None if stuck.
+
+        Searches for time_limit seconds, or for a fixed number of iterations if set.
+        """
+        root = self._root(pack_state(board.export_state()))
+        if not root.untried and not root.children:
+            self._last = None
+            return None
+        begin = time.time()
+        done = 0
+        while True:
+            self._iterate(root)
+            done += 1
+            if self.node_count > self.max_nodes:
+                self._prune(root)
+            if self.iterations is not None:
+                if done >= self.iterations:
+                    break
+            elif time.time() - begin >= self.time_limit:
+                break
+        move = max(root.children, key=lambda m: root.children[m].visits)
+        self._last = root.children[move]
+        return move
+
+    def _root(self, packed):
+        """Reuse the subtree for packed under the last chosen move, or start afresh."""
+        root = self._last.children.get(packed) if self._last is not None else None
+        if root is None:
+            root = DecisionNode(packed)
+            self.node_count = 1
+        else:
+            self.node_count = count_nodes(root)
+        return root
+
+    def _select(self, node):
+        log_visits = math.log(node.visits)
+        # Scale exploration to the size of the returns seen from this node.
+        scale = max(node.total / node.visits, 1.0)
+        best = None
+        best_value = float('-inf')
+        for chance in node.children.values():
+            value = (chance.total / chance.visits / scale +
+                     self.exploration * math.sqrt(log_visits / chance.visits))
+            if value > best_value:
+                best_value = value
+                best = chance
+        return best
+
+    def _iterate(self, root):
+        rng = self.rng
+        node = root
+        path = [root]
+        while True:
+            if node.untried:
+                move = node.untried.pop()
+                after, gain, _ = MOVE_FUNCTIONS[move](node.board)
+                chance = ChanceNode(after, gain)
+                node.children[move] = chance
+                spawned = spawn_tile(after, rng)
+                child = DecisionNode(spawned)
+                chance.children[spawned] = child
+                self.node_count += 2
+                path.append(chance)
+                path.append(child)
+                value = random_playout(spawned, rng)
+                break
+            if not node.children:
+                # No legal moves: the game ends here.
+                value = 0
+                break
+            chance = self._select(node)
+            spawned = spawn_tile(chance.board, rng)
+            child = chance.children.get(spawned)
+            path.append(chance)
+            if child is None:
+                child = DecisionNode(spawned)
+                chance.children[spawned] = child
+                self.node_count += 1
+                path.append(child)
+                value = random_playout(spawned, rng)
+                break
+            path.append(child)
+            node = child
+        for node in reversed(path):
+            if type(node) is ChanceNode:
+                value += node.gain
+            node.visits += 1
+            node.total += value
+
+    def _prune(self, root):
+        """Drop subtrees with few visits until the tree is back to three quarters of max_nodes.
+
+        Stops early once only the root and its chance nodes are left, which are
+        never pruned, so a tiny max_nodes cannot loop forever.
+        """
+        threshold = 1
+        while self.node_count > self.max_nodes * 3 // 4:
+            stack = [root]
+            prunable = False
+            while stack:
+                node = stack.pop()
+                if type(node) is ChanceNode:
+                    for key in [k for k, child in node.children.items() if child.visits <= threshold]:
+                        del node.children[key]
+                    prunable = prunable or bool(node.children)
+                stack.extend(node.children.values())
+            self.node_count = count_nodes(root)
+            if not prunable:
+                break
+            threshold *= 2
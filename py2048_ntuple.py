@@ -0,0 +1,267 @@
+"""
+Python 2048 Game : N-Tuple Network Value Function
+
+An n-tuple network values a board as the sum of table weights looked up by the
+exponents found in a few small groups of cells.  Every tuple is sampled under
+the 8 rotations and reflections of the board, and all eight placements share
+one weight table, so the network learns each pattern once whichever way round
+it appears.  Weight tables are flat float32 arrays with 16 ** len(tuple)
+entries; exponents above 15 are capped at 15.
+
+The network values afterstates (the board after a move, before the spawn) as
+the score still to come, so score + value() estimates the final score, the same
+units as py2048_heuristic.leaf_value().  train() learns the weights by TD(0) or
+TD(lambda) self-play on Board:
+
+    network = NTupleNetwork(SMALL_TUPLES)
+    train(network, games=2000, seed=1)
+    network.save('weights.ntn')
+    agent = NTupleAgent(NTupleNetwork.load('weights.ntn'))
+
+A weights file is the magic FILE_MAGIC, a HEADER with the tuple count, one TUPLE
+record per tuple and then the float32 tables back to back, so load() can map
+the tables straight out of the file without reading it in.
+"""
+
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+
+from py2048_classes import Board, RandomStream
+from py2048_symmetry import PERMUTATIONS
+
+FILE_MAGIC = b'2048NTN1'
+HEADER = struct.Struct('<8sII')
+TUPLE = struct.Struct('<B7B')
+NO_CELL = 255
+
+# The four 6-tuples of Wu et al. (2014): two rectangles and two L-shapes.
+DEFAULT_TUPLES = (
+    (0, 1, 2, 3, 4, 5),
+    (4, 5, 6, 7, 8, 9),
+    (0, 1, 2, 4, 5, 6),
+    (4, 5, 6, 8, 9, 10),
+)
+# Straight lines and squares of 4 cells; small enough to train in minutes.
+SMALL_TUPLES = (
+    (0, 1, 2, 3),
+    (4, 5, 6, 7),
+    (0, 1, 4, 5),
+    (1, 2, 5, 6),
+    (5, 6, 9, 10),
+)
+
+
+def symmetric_placements(cells):
+    """Return the distinct placements of a tuple of cell indices under the 8 board symmetries."""
+    placements = []
+    for permutation in PERMUTATIONS:
+        placement = tuple(permutation[i] for i in cells)
+        if placement not in placements:
+            placements.append(placement)
+    return placements
+
+
+class NTupleNetwork:
+    """Symmetric n-tuple value function over Board cells (flat exponent lists)."""
+
+    def __init__(self, tuples=DEFAULT_TUPLES, tables=None):
+        for cells in tuples:
+            if not 1 <= len(cells) <= TUPLE.size - 1 or not all(0 <= i < 16 for i in cells):
+                raise ValueError("bad tuple {!r}".format(cells))
+        self.tuples = tuple(tuple(cells) for cells in tuples)
+        if tables is None:
+            tables = [array('f', bytes(4 * 16 ** len(cells))) for cells in self.tuples]
+        self.tables = tables
+        self.placements = [symmetric_placements(cells) for cells in self.tuples]
+        self.feature_count = sum(len(placements) for placements in self.placements)
+        self._map = None
+        self._file = None
+
+    def features(self, cells):
+        """Return the (table, index) pairs active for a flat list of 16 exponents."""
+        if max(cells) > 15:
+            cells = [v if v < 16 else 15 for v in cells]
+        active = []
+        for table, placements in zip(self.tables, self.placements):
+            for placement in placements:
+                index = 0
+                for i in placement:
+                    index = (index << 4) | cells[i]
+                active.append((table, index))
+        return active
+
+    def value(self, cells):
+        """Expected score still to come from the afterstate with these cells."""
+        return sum(table[index] for table, index in self.features(cells))
+
+    def value_of(self, features):
+        return sum(table[index] for table, index in features)
+
+    def update(self, features, delta):
+        """Add delta to every active weight (the tables must be writable)."""
+        for table, index in features:
+            table[index] += delta
+
+    def leaf_value(self, board, score):
+        """Estimated final score of a packed board (py2048_bitboard layout) reached with the given score."""
+        return score + self.value([(board >> (4 * i)) & 0xF for i in range(16)])
+
+    def best_afterstate(self, board):
+        """Greedy choice for board: (reward + value, move, reward, features), or None if no move is legal."""
+        best = None
+        for move in board.possible_moves():
+            before = board.score
+            board.make_move(move)
+            reward = board.score - before
+            features = self.features(board.cells)
+            total = reward + self.value_of(features)
+            board.unmake()
+            if best is None or total > best[0]:
+                best = (total, move, reward, features)
+        return best
+
+    def save(self, path):
+        with open(path, 'wb') as out:
+            out.write(HEADER.pack(FILE_MAGIC, len(self.tuples), 0))
+            for cells in self.tuples:
+                out.write(TUPLE.pack(len(cells), *(cells + (NO_CELL,) * (TUPLE.size - 1 - len(cells)))))
+            for table in self.tables:
+                out.write(table)
+
+    @classmethod
+    def load(cls, path, writable=False):
+        """Load a weights file.
+
+        By default the tables are read-only views of a memory mapping, so many
+        processes can share one copy of the weights; writable=True copies them
+        into arrays instead, e.g. to continue training.
+        """
+        weights = open(path, 'rb')
+        mapping = mmap.mmap(weights.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, _ = HEADER.unpack_from(mapping, 0)
+        if magic != FILE_MAGIC:
+            mapping.close()
+            weights.close()
+            raise ValueError("{} is not an n-tuple weights file".format(path))
+        tuples = []
+        offset = HEADER.size
+        for _ in range(count):
+            length, *cells = TUPLE.unpack_from(mapping, offset)
+            tuples.append(tuple(cells[:length]))
+            offset += TUPLE.size
+        view = memoryview(mapping)
+        tables = []
+        for cells in tuples:
+            size = 4 * 16 ** len(cells)
+            if writable:
+                table = array('f')
+                table.frombytes(view[offset:offset + size])
+                tables.append(table)
+            else:
+                tables.append(view[offset:offset + size].cast('f'))
+            offset += size
+        if writable:
+            view.release()
+            mapping.close()
+            weights.close()
+            return cls(tuples, tables)
+        network = cls(tuples, tables)
+        network._map = mapping
+        network._file = weights
+        return network
+
+    def close(self):
+        """Release a mapping opened by load(); the network is unusable afterwards."""
+        if self._map is not None:
+            for table in self.tables:
+                table.release()
+            self.tables = []
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+
+class NTupleAgent:
+    """Plays the move with the best reward plus afterstate value; no search."""
+
+    def __init__(self, network):
+        self.network = network
+
+    def choose_move(self, board):
+        return self.network.best_afterstate(board)[1]
+
+
+def train_game(network, board, alpha, lambda_=0.0):
+    """Play one self-play game on a fresh board and learn from it; returns the board.
+
+    alpha is the learning rate shared out over the active features.  With
+    lambda_ = 0 every afterstate is updated online towards the next reward plus
+    the next afterstate's value (TD(0)); otherwise the updates use lambda-returns
+    and are applied backwards once the game is over.
+    """
+    step = alpha / network.feature_count
+    board.add_random_tiles(2)
+    choice = network.best_afterstate(board)
+    history = []
+    while choice is not None:
+        total, move, reward, features = choice
+        board.make_move(move)
+        board.add_random_tiles(1)
+        board.clear_undo()
+        choice = network.best_afterstate(board)
+        # The TD target: the next reward plus the next afterstate's value, or 0 at the end.
+        target = choice[0] if choice is not None else 0.0
+        if lambda_:
+            history.append((features, total - reward, target))
+        else:
+            network.update(features, step * (target - (total - reward)))
+    following = following_value = 0.0
+    for features, value, target in reversed(history):
+        ret = target + lambda_ * (following - following_value)
+        network.update(features, step * (ret - value))
+        following, following_value = ret, value
+    return board
+
+
+def train(network, games, alpha=0.1, lambda_=0.0, seed=None, on_game=None):
+    """Train network by self-play for games games; on_game(game, board) is called after each."""
+    rng = RandomStream(seed)
+    for game in range(games):
+        board = train_game(network, Board(rng=rng), alpha, lambda_)
+        if on_game is not None:
+            on_game(game, board)
+    return network
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--tuples', choices=('default', 'small'), default='small')
+    parser.add_argument('--alpha', type=float, default=0.1)
+    parser.add_argument('--lambda', dest='lambda_', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--resume', help="continue training the weights in this file")
+    parser.add_argument('--output', default='weights.ntn')
+    parser.add_argument('--report-every', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.resume:
+        network = NTupleNetwork.load(args.resume, writable=True)
+    else:
+        network = NTupleNetwork(DEFAULT_TUPLES if args.tuples == 'default' else SMALL_TUPLES)
+    scores = []
+
+    def progress(game, board):
+        scores.append(board.score)
+        if len(scores) == args.report_every:
+            print("games {:>7}  mean score {:9.1f}  max tile {:>5}".format(
+                game + 1, sum(scores) / len(scores), board.get_max_tile()[0]), file=sys.stderr)
+            del scores[:]
+
+    try:
+        train(network, args.games, args.alpha, args.lambda_, args.seed, progress)
+    finally:
+        network.save(args.output)
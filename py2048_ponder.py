@@ -0,0 +1,173 @@
+"""
+Python 2048 Game : Background Pondering for Interactive Play
+
+A Ponderer searches while the game loop waits for a key.  Between start() and
+stop() a background thread plays random rollouts (MatthewStarkey2048's
+measured_rollout) for the current position and for the positions that may
+follow it: every legal move followed by every possible spawn.  Work is spread
+in proportion to how likely each position is to be reached, counting the
+current position as certain, the currently preferred move as the likeliest
+reply and spawns as the game draws them (a 2 four times in five, on any empty
+cell), so the position after the player's next move has usually been searched
+before it appears.
+
+Results are kept per position as running totals of the score still to come
+after each move, so a later search of the same position carries on from them:
+best() answers at once from what has been pondered, topping up in the calling
+thread only when the position has fewer than min_rollouts rollouts per move.
+Tile sums only grow, so a position can never come round again once passed:
+start() keeps the results for the new position, usually pondered as one of
+the previous position's successors, and drops the rest; restarting on the
+same position, as after a hint or an illegal key, keeps them all.
+
+stop() sets an event the worker checks between rollouts and waits for it, so
+cancelling costs at most one rollout.  The worker runs while the main thread
+is blocked reading the keyboard, which releases the GIL.
+"""
+
+import threading
+import time
+
+from MatthewStarkey2048 import measured_rollout
+from py2048_classes import Board, RandomStream
+
+# Rollouts per legal move each time a position is visited.
+VISIT_ROLLOUTS = 8
+# Rollouts per move the current position gets before its replies are expanded.
+EXPAND_AFTER = 32
+# Share of the reply weight given to the currently preferred move.
+PREFERRED_SHARE = 0.5
+
+
+class _Position:
+    __slots__ = ('state', 'score', 'weight', 'moves', 'totals', 'counts')
+
+    def __init__(self, board, weight):
+        self.state = board.export_state()
+        self.score = board.score
+        self.weight = weight
+        self.moves = board.possible_moves()
+        self.totals = [0.0] * len(self.moves)
+        self.counts = [0] * len(self.moves)
+
+    def rollouts(self):
+        return min(self.counts) if self.counts else 0
+
+    def best(self):
+        """(move, mean score still to come, rollouts per move) for the best mean so far."""
+        if not self.moves or not self.counts[0]:
+            return (self.moves[0] if self.moves else None), None, 0
+        value, move = max((total / count, move) for total, count, move in zip(self.totals, self.counts, self.moves))
+        return move, value, self.rollouts()
+
+
+def _key(board):
+    return board.size, tuple(board.cells)
+
+
+class Ponderer:
+    """Background search over the current position and its likely successors."""
+
+    def __init__(self, seed=None, max_plies=None):
+        self.max_plies = max_plies
+        self.rollouts = 0
+        self._rng = RandomStream(seed)
+        self._positions = {}
+        self._root = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _position(self, board, weight):
+        key = _key(board)
+        position = self._positions.get(key)
+        if position is None:
+            position = self._positions[key] = _Position(board, weight)
+        else:
+            position.weight = max(position.weight, weight)
+        return position
+
+    def _visit(self, position, board, rollouts=VISIT_ROLLOUTS):
+        """Add rollouts rollouts per move to position, played on board (a copy of it); False if stopped."""
+        for _ in range(rollouts):
+            for i, move in enumerate(position.moves):
+                if self._stop.is_set():
+                    return False
+                value, _ = measured_rollout(board, move, self.max_plies)
+                position.totals[i] += value - position.score
+                position.counts[i] += 1
+                self.rollouts += 1
+        return True
+
+    def _expand(self, root):
+        """Register every position one move and one spawn after root, weighted by its likelihood."""
+        preferred = root.best()[0]
+        others = len(root.moves) - 1
+        for move in root.moves:
+            if not others:
+                share = 1.0
+            elif move == preferred:
+                share = PREFERRED_SHARE
+            else:
+                share = (1 - PREFERRED_SHARE) / others
+            after = Board(root.state, root.score, rng=self._rng)
+            after.make_move(move)
+            n = after.size
+            empty = [i for i, v in enumerate(after.cells) if not v]
+            for i in empty:
+                for exponent, chance in ((1, 0.8), (2, 0.2)):
+                    cells = after.cells[:]
+                    cells[i] = exponent
+                    child = Board([cells[k:k + n] for k in range(0, n * n, n)], after.score, rng=self._rng)
+                    self._position(child, share * chance / len(empty))
+
+    def _run(self):
+        root = self._root
+        expanded = False
+        while not self._stop.is_set():
+            if not expanded and root.rollouts() >= EXPAND_AFTER:
+                self._expand(root)
+                expanded = True
+            # Visit whichever position is furthest behind its share of the work.
+            position = max((position for position in self._positions.values() if position.moves),
+                           key=lambda position: position.weight / (1 + position.rollouts()), default=None)
+            if position is None:
+                return
+            if not self._visit(position, Board(position.state, position.score, rng=self._rng)):
+                return
+
+    def start(self, board):
+        """Begin pondering board's position in the background (stopping any earlier search)."""
+        self.stop()
+        key = _key(board)
+        root = self._positions.get(key)
+        if root is None or root is not self._root:
+            self._positions = {}
+        if root is None:
+            root = _Position(board, 1.0)
+        root.weight = 1.0
+        self._positions[key] = self._root = root
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Cancel the background search and wait for it; what it found is kept."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._stop.clear()
+
+    def best(self, board, min_rollouts=EXPAND_AFTER, time_limit=0.25):
+        """Return (move, mean score still to come, rollouts per move) for board's position.
+
+        Uses what has been pondered; if that is fewer than min_rollouts per
+        move, searches in the calling thread until it is or time_limit runs
+        out.  Call between stop() and start().
+        """
+        position = self._position(board, 1.0)
+        search = Board(position.state, position.score, rng=self._rng)
+        deadline = time.time() + time_limit
+        while position.moves and position.rollouts() < min_rollouts and time.time() < deadline:
+            self._visit(position, search, 1)
+        return position.best()
+
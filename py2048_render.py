@@ -0,0 +1,113 @@
+"""
+Python 2048 Game : Game Loop Renderers
+
+The game loops draw through a renderer with three methods: frame(board,
+status) after every move, message(text) for one-off lines and close() at the
+end.
+
+    TextRenderer   prints the status line and the whole board every move, as
+                   the loops always have
+    AnsiRenderer   draws the board once, then rewrites only the cells that
+                   changed plus the metrics and status lines, sending each
+                   frame to the terminal in a single write
+    QuietRenderer  draws nothing, for batch runs
+"""
+
+import sys
+
+CELL_PADDING = 8
+RENDERERS = ('text', 'ansi', 'quiet')
+
+
+class QuietRenderer:
+    """Renderer that skips all output."""
+
+    def frame(self, board, status):
+        pass
+
+    def message(self, text):
+        pass
+
+    def close(self):
+        pass
+
+
+class TextRenderer:
+    """Print the status line and the full board every frame."""
+
+    def frame(self, board, status):
+        print(status)
+        print(board)
+
+    def message(self, text):
+        print(text)
+
+    def close(self):
+        pass
+
+
+class AnsiRenderer:
+    """Redraw only what changed, with ANSI cursor positioning.
+
+    Screen layout: the metrics line, the status line, then the board with a
+    divider above and below every row; messages go on the line under the board.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = sys.stdout if stream is None else stream
+        self._cells = None
+        self._size = None
+
+    def _cell(self, parts, size, i, v):
+        y, x = divmod(i, size)
+        parts.append("\x1b[{};{}H".format(4 + 2 * y, 2 + x * (CELL_PADDING + 1)))
+        parts.append("{: ^{padding}}".format(2 ** v, padding=CELL_PADDING) if v else " " * CELL_PADDING)
+
+    def frame(self, board, status):
+        cells = board.cells
+        size = board.size
+        parts = []
+        if self._size != size:
+            # First frame (or a new board size): clear the screen and draw the grid lines once.
+            divider = "-" * ((CELL_PADDING + 1) * size + 1)
+            row = "|" + (" " * CELL_PADDING + "|") * size
+            parts.append("\x1b[2J\x1b[3;1H")
+            parts.append("\n".join([divider, row] * size + [divider]))
+            self._size = size
+            self._cells = [0] * len(cells)
+            for i, v in enumerate(cells):
+                self._cell(parts, size, i, v)
+        else:
+            drawn = self._cells
+            for i, v in enumerate(cells):
+                if drawn[i] != v:
+                    self._cell(parts, size, i, v)
+        self._cells = cells[:]
+        top = max(cells)
+        parts.append("\x1b[1;1HScore:{}, Merge count:{}, Max tile:{}\x1b[K".format(
+            board.score, board.merge_count, 2 ** top if top else 0))
+        parts.append("\x1b[2;1H{}\x1b[K".format(status))
+        parts.append("\x1b[{};1H".format(5 + 2 * size))
+        self.stream.write("".join(parts))
+        self.stream.flush()
+
+    def message(self, text):
+        row = 5 + 2 * self._size if self._size else 1
+        self.stream.write("\x1b[{};1H{}\x1b[K".format(row, text))
+        self.stream.flush()
+
+    def close(self):
+        if self._size:
+            self.stream.write("\x1b[{};1H\n".format(6 + 2 * self._size))
+            self.stream.flush()
+
+
+def make_renderer(name):
+    """Build a renderer by name: 'text', 'ansi' or 'quiet'."""
+    if name == 'text':
+        return TextRenderer()
+    if name == 'ansi':
+        return AnsiRenderer()
+    if name == 'quiet':
+        return QuietRenderer()
+    raise ValueError("unknown renderer {!r}; expected one of {}".format(name, ', '.join(RENDERERS)))
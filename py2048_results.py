@@ -0,0 +1,139 @@
+"""
+Python 2048 Game : Streaming Results Log
+
+ResultsWriter appends one JSON object per finished game to a JSON Lines file,
+keeping a single buffered handle open for the whole session and flushing every
+few games or seconds.  read_results() and summarise_results() stream the file
+back a line at a time, so large logs never have to fit in memory.
+"""
+
+import json
+import math
+import time
+
+from py2048_instrument import RunningStats
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(fraction * len(ordered))))
+    return ordered[rank - 1]
+
+
+def game_record(seed, board, latencies, rollouts_per_move=None, **fields):
+    """Build the standard per-game record for a finished Board."""
+    record = {
+        'seed': seed,
+        'score': board.score,
+        'merge_count': board.merge_count,
+        'max_tile': board.get_max_tile()[0],
+        'moves': len(latencies),
+        'mean_move_latency': sum(latencies) / len(latencies) if latencies else 0.0,
+        'p95_move_latency': percentile(latencies, 0.95) if latencies else 0.0,
+        'rollouts_per_move': (sum(rollouts_per_move) / len(rollouts_per_move)) if rollouts_per_move else None,
+        'finished_at': time.time(),
+    }
+    record.update(fields)
+    return record
+
+
+class ResultsWriter:
+    """Append-only JSON Lines writer that keeps one file handle for the session."""
+
+    def __init__(self, path, flush_every=10, flush_interval=5.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._file = open(path, 'a', buffering=1 << 16)
+        self._pending = 0
+        self._last_flush = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, record):
+        self._file.write(json.dumps(record, separators=(',', ':')) + "\n")
+        self._pending += 1
+        if self._pending >= self.flush_every or time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._pending = 0
+        self._last_flush = time.time()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def read_results(path):
+    """Yield the records of a results log one at a time.
+
+    Blank lines and every line that is not valid JSON are skipped, wherever
+    they are.  A run killed mid-write leaves a truncated line, and the next
+    session appending to the log continues that same line, so such damage can
+    sit anywhere in the file, not just at the end.
+    """
+    with open(path) as results:
+        for line in results:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+class ResultsSummary:
+    """Streaming aggregate over game records."""
+
+    def __init__(self):
+        self.score = RunningStats()
+        self.moves = RunningStats()
+        self.latency = RunningStats()
+        self.min_score = None
+        self.max_score = None
+        self.max_tiles = {}
+
+    def add(self, record):
+        score = record['score']
+        self.score.add(score)
+        self.moves.add(record['moves'])
+        self.latency.add(record['mean_move_latency'])
+        self.min_score = score if self.min_score is None else min(self.min_score, score)
+        self.max_score = score if self.max_score is None else max(self.max_score, score)
+        self.max_tiles[record['max_tile']] = self.max_tiles.get(record['max_tile'], 0) + 1
+
+    def as_dict(self):
+        return {
+            'games': self.score.count,
+            'mean_score': self.score.mean,
+            'score_stddev': math.sqrt(self.score.variance()),
+            'min_score': self.min_score,
+            'max_score': self.max_score,
+            'mean_moves': self.moves.mean,
+            'mean_move_latency': self.latency.mean,
+            'max_tiles': dict(sorted(self.max_tiles.items())),
+        }
+
+
+def summarise_results(path):
+    """Aggregate statistics over every game in a results log."""
+    summary = ResultsSummary()
+    for record in read_results(path):
+        summary.add(record)
+    return summary.as_dict()
+
+
+if __name__ == "__main__":
+    import sys
+
+    for path in sys.argv[1:]:
+        print(path, json.dumps(summarise_results(path), indent=2))
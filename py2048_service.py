@@ -0,0 +1,341 @@
+"""
+Python 2048 Game : Multi-Session Decision Service
+
+Serves move decisions for many concurrent games over a local socket.  Clients
+send one JSON object per line and get one line back per request, matched by id:
+
+    {"id": 7, "session": "game-3", "state": [[1, null, null, null], ...], "score": 120, "time_limit": 0.5}
+    {"id": 7, "session": "game-3", "move": "LEFT", "value": 2431.5, "rollouts": 384, "fallback": false}
+
+state is an export_state() grid and time_limit the seconds the client is
+willing to wait, capped at MAX_TIME_LIMIT.  All pending requests, from every session, share rounds of
+batched rollouts on the NumPy simulator (py2048_batch): one round plays
+rollouts_per_round rollouts for every candidate move of every pending position
+in a single lockstep batch, so the cost of a round grows far more slowly than
+the number of sessions in it.  New requests join at the next round, and each
+is answered after the last round that fits before its deadline, or once every
+candidate has max_rollouts rollouts.  A request whose deadline is too close
+for even one round gets the move that py2048_heuristic.evaluate() likes best
+and is marked as a fallback.
+
+Backpressure comes from a bounded queue of waiting requests and a cap on the
+requests in flight per connection: when either is full the server stops
+reading from that connection until answers go out.
+
+    python py2048_service.py --port 2048 --workers 4
+    MatthewStarkey2048.main(agent=ServiceAgent(port=2048, time_limit=0.5))
+
+Requires NumPy.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import socket
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from py2048_batch import MOVE_INDEX, batched_rollouts
+from py2048_bitboard import MOVE_FUNCTIONS, legal_moves, pack_state
+from py2048_classes import RandomStream
+from py2048_heuristic import evaluate
+
+# Longest a request may wait; beyond this it would hold a pending slot and keep rounds running for too long.
+MAX_TIME_LIMIT = 60.0
+
+
+def parse_state(state):
+    """Pack a JSON export_state() grid, rejecting anything that is not 4x4 exponents or nulls."""
+    if not isinstance(state, list) or len(state) != 4 or any(not isinstance(row, list) or len(row) != 4
+                                                             for row in state):
+        raise ValueError("state must be a 4x4 grid")
+    for row in state:
+        for element in row:
+            if element is not None and (not isinstance(element, int) or not 0 <= element <= 15):
+                raise ValueError("cells must be exponents 0-15 or null")
+    return pack_state(state)
+
+
+def parse_score(score):
+    """Check a request's score fits the int64 score array a round is batched into."""
+    if isinstance(score, bool) or not isinstance(score, int) or not 0 <= score < 2 ** 63:
+        raise ValueError("score must be a non-negative integer below 2**63")
+    return score
+
+
+def greedy_move(board, posses):
+    """The candidate whose afterstate py2048_heuristic.evaluate() scores highest."""
+    return max(posses, key=lambda move: evaluate(MOVE_FUNCTIONS[move](board)[0]))
+
+
+def simulate(boards, scores, first_moves, seed):
+    """Executor entry point: final rollout scores for one slice of a round."""
+    return batched_rollouts(boards, first_moves, scores, 0, np.random.default_rng(seed))[0]
+
+
+class _Request:
+    __slots__ = ('future', 'session', 'board', 'score', 'posses', 'deadline', 'totals', 'rollouts')
+
+    def __init__(self, future, session, board, score, posses, deadline):
+        self.future = future
+        self.session = session
+        self.board = board
+        self.score = score
+        self.posses = posses
+        self.deadline = deadline
+        self.totals = [0] * len(posses)
+        self.rollouts = 0
+
+
+class DecisionService:
+    """Batches move requests from many sessions into shared rounds of rollouts.
+
+    With workers set, each round is split across a pool of that many processes;
+    otherwise rounds run on a thread so the event loop stays responsive.
+    """
+
+    def __init__(self, rollouts_per_round=16, max_rollouts=None, max_pending=256, queue_size=1024,
+                 max_in_flight=64, workers=None, seed=None):
+        self.rollouts_per_round = rollouts_per_round
+        self.max_rollouts = max_rollouts
+        self.max_pending = max_pending
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight
+        self.workers = workers
+        self.served = 0
+        self.fallbacks = 0
+        self.rounds = 0
+        self._rng = RandomStream(seed)
+        self._queue = None
+        self._executor = None
+        self._batcher = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        if self.workers:
+            self._executor = ProcessPoolExecutor(self.workers)
+        self._batcher = asyncio.create_task(self._run())
+
+    async def close(self):
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    async def decide(self, state, score=0, time_limit=1.0, session=None):
+        """Return the response dict for one position; waits while the queue is full.
+
+        time_limit is capped at MAX_TIME_LIMIT; a bad state or score raises
+        ValueError here, before the request can join a shared round.
+        """
+        if math.isnan(time_limit):
+            raise ValueError("time_limit must be a number")
+        time_limit = min(time_limit, MAX_TIME_LIMIT)
+        board = parse_state(state)
+        score = parse_score(score)
+        posses = legal_moves(board)
+        if len(posses) < 2:
+            self.served += 1
+            return {'session': session, 'move': posses[0] if posses else None, 'value': None, 'rollouts': 0,
+                    'fallback': False}
+        loop = asyncio.get_running_loop()
+        request = _Request(loop.create_future(), session, board, score, posses, loop.time() + time_limit)
+        await self._queue.put(request)
+        return await request.future
+
+    def _answer(self, request):
+        if request.future.done():
+            return
+        if request.rollouts:
+            value, move = max(zip(request.totals, request.posses))
+            value /= request.rollouts
+            fallback = False
+        else:
+            move = greedy_move(request.board, request.posses)
+            value = None
+            fallback = True
+            self.fallbacks += 1
+        self.served += 1
+        request.future.set_result({'session': request.session, 'move': move, 'value': value,
+                                   'rollouts': request.rollouts * len(request.posses), 'fallback': fallback})
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        active = []
+        round_time = 0.0
+        while True:
+            if not active:
+                active.append(await self._queue.get())
+            while len(active) < self.max_pending and not self._queue.empty():
+                active.append(self._queue.get_nowait())
+            # Answer everything that could not wait for another round.
+            now = loop.time()
+            batch = []
+            for request in active:
+                if request.future.done():
+                    continue
+                if request.deadline - now < round_time:
+                    self._answer(request)
+                else:
+                    batch.append(request)
+            active = batch
+            if not active:
+                # Nothing fitted, so the estimate may be stale from a bigger batch: let it recover.
+                round_time *= 0.5
+                continue
+            begin = loop.time()
+            try:
+                await self._round(loop, active)
+            except Exception as error:
+                # Fail this batch's requests rather than leave their sessions waiting forever.
+                for request in active:
+                    if not request.future.done():
+                        request.future.set_exception(error)
+                active = []
+                continue
+            # Rounds grow with the batch, so track the recent cost rather than a fixed guess.
+            round_time = max(loop.time() - begin, 0.5 * round_time)
+            if self.max_rollouts is not None:
+                for request in active:
+                    if request.rollouts >= self.max_rollouts:
+                        self._answer(request)
+
+    async def _round(self, loop, active):
+        per = self.rollouts_per_round
+        candidates = [(request, move) for request in active for move in request.posses]
+        boards = np.repeat(np.array([request.board for request, _ in candidates], dtype=np.uint64), per)
+        scores = np.repeat(np.array([request.score for request, _ in candidates], dtype=np.int64), per)
+        first_moves = np.repeat(np.array([MOVE_INDEX[move] for _, move in candidates], dtype=np.intp), per)
+        parts = min(self.workers or 1, len(candidates))
+        jobs = [loop.run_in_executor(self._executor, simulate, b, s, f, self._rng.seed_value())
+                for b, s, f in zip(np.array_split(boards, parts), np.array_split(scores, parts),
+                                   np.array_split(first_moves, parts))]
+        totals = np.concatenate(await asyncio.gather(*jobs)).reshape(-1, per).sum(axis=1)
+        k = 0
+        for request in active:
+            for i in range(len(request.posses)):
+                request.totals[i] += int(totals[k])
+                k += 1
+            request.rollouts += per
+        self.rounds += 1
+
+    async def handle_connection(self, reader, writer):
+        """Serve newline-delimited JSON requests from one client until it disconnects."""
+        slots = asyncio.Semaphore(self.max_in_flight)
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                # Stop reading while max_in_flight requests are unanswered.
+                await slots.acquire()
+                line = await reader.readline()
+                if not line:
+                    slots.release()
+                    break
+                task = asyncio.create_task(self._serve_line(line, writer, lock, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _serve_line(self, line, writer, lock, slots):
+        message = {}
+        try:
+            try:
+                parsed = json.loads(line)
+                if not isinstance(parsed, dict):
+                    raise ValueError("a request must be a JSON object")
+                message = parsed
+                response = await self.decide(message['state'], message.get('score', 0),
+                                             float(message.get('time_limit', 1.0)), message.get('session'))
+            except Exception as error:
+                # Bad requests and failed rounds alike get an error reply, so the client never waits forever.
+                response = {'session': message.get('session'), 'error': str(error) or type(error).__name__}
+            response['id'] = message.get('id')
+            async with lock:
+                writer.write((json.dumps(response, separators=(',', ':')) + "\n").encode())
+                await writer.drain()
+        finally:
+            slots.release()
+
+
+async def serve(service, host='127.0.0.1', port=2048, path=None):
+    """Run service on a TCP port, or on a Unix socket at path, until cancelled."""
+    async with service:
+        if path is not None:
+            server = await asyncio.start_unix_server(service.handle_connection, path)
+        else:
+            server = await asyncio.start_server(service.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class ServiceAgent:
+    """Blocking client that asks a running DecisionService for each move; usable as a main() agent."""
+
+    def __init__(self, host='127.0.0.1', port=2048, time_limit=0.5, session=None, path=None):
+        if path is not None:
+            self._socket = socket.socket(socket.AF_UNIX)
+            self._socket.connect(path)
+        else:
+            self._socket = socket.create_connection((host, port))
+        self._file = self._socket.makefile('rwb')
+        self.time_limit = time_limit
+        self.session = session
+        self._next_id = 0
+
+    def choose_move(self, board):
+        self._next_id += 1
+        request = {'id': self._next_id, 'session': self.session, 'state': board.export_state(),
+                   'score': board.score, 'time_limit': self.time_limit}
+        self._file.write((json.dumps(request, separators=(',', ':')) + "\n").encode())
+        self._file.flush()
+        response = json.loads(self._file.readline())
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['move']
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2048)
+    parser.add_argument('--unix', help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--workers', type=int, default=None, help="processes per round (default: one thread)")
+    parser.add_argument('--rollouts-per-round', type=int, default=16)
+    parser.add_argument('--max-rollouts', type=int, default=None, help="answer once each candidate has this many")
+    parser.add_argument('--max-pending', type=int, default=256, help="requests sharing one round")
+    parser.add_argument('--queue-size', type=int, default=1024)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    decisions = DecisionService(args.rollouts_per_round, args.max_rollouts, args.max_pending, args.queue_size,
+                                workers=args.workers, seed=args.seed)
+    print("serving on", args.unix or "{}:{}".format(args.host, args.port), file=sys.stderr)
+    try:
+        asyncio.run(serve(decisions, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,135 @@
+"""
+Python 2048 Game : Board Symmetries
+
+The board looks the same to the game under its 8 rotations and reflections (the
+dihedral group of the square), so positions that differ only by one of them
+have the same value.  canonical() picks one representative of each class of
+packed boards (py2048_bitboard layout), the smallest of the eight, so caches
+and datasets can key on it; the moves of the canonical board map back to the
+original through the symmetry it returns.
+
+Symmetry s sends cell (x, y) to TRANSFORMS[s](x, y):
+
+    0 identity         4 transpose
+    1 mirror x         5 transpose, then mirror x
+    2 mirror y         6 transpose, then mirror y
+    3 rotate 180       7 transpose, then rotate 180
+"""
+
+from py2048_bitboard import MOVES, pack_state, transpose
+
+TRANSFORMS = (
+    lambda x, y: (x, y),
+    lambda x, y: (3 - x, y),
+    lambda x, y: (x, 3 - y),
+    lambda x, y: (3 - x, 3 - y),
+    lambda x, y: (y, x),
+    lambda x, y: (3 - y, x),
+    lambda x, y: (y, 3 - x),
+    lambda x, y: (3 - y, 3 - x),
+)
+# PERMUTATIONS[s][i] is the cell that cell i moves to under symmetry s.
+PERMUTATIONS = tuple(tuple(4 * y + x for x, y in (transform(i % 4, i // 4) for i in range(16)))
+                     for transform in TRANSFORMS)
+INVERSE = tuple(PERMUTATIONS.index(tuple(sorted(range(16), key=permutation.__getitem__)))
+                for permutation in PERMUTATIONS)
+
+# The direction each move pushes tiles, as (dx, dy).
+_DIRECTIONS = {'UP': (0, -1), 'DOWN': (0, 1), 'LEFT': (-1, 0), 'RIGHT': (1, 0)}
+
+
+def _move_map(transform):
+    mapped = {}
+    for move, (dx, dy) in _DIRECTIONS.items():
+        x0, y0 = transform(1, 1)
+        x1, y1 = transform(1 + dx, 1 + dy)
+        mapped[move] = next(m for m, d in _DIRECTIONS.items() if d == (x1 - x0, y1 - y0))
+    return mapped
+
+
+# MOVE_MAPS[s][move] is the move on the transformed board that matches move on the original.
+MOVE_MAPS = tuple(_move_map(transform) for transform in TRANSFORMS)
+
+
+def mirror_x(board):
+    """Reverse every row of a packed board."""
+    return (((board & 0x000F000F000F000F) << 12) | ((board & 0x00F000F000F000F0) << 4) |
+            ((board >> 4) & 0x00F000F000F000F0) | ((board >> 12) & 0x000F000F000F000F))
+
+
+def mirror_y(board):
+    """Reverse the order of the rows of a packed board."""
+    return (((board & 0xFFFF) << 48) | ((board & 0xFFFF0000) << 16) |
+            ((board >> 16) & 0xFFFF0000) | (board >> 48))
+
+
+def symmetries(board):
+    """Return the packed board under each of the 8 symmetries, indexed as TRANSFORMS."""
+    x = mirror_x(board)
+    y = mirror_y(board)
+    t = transpose(board)
+    tx = mirror_x(t)
+    ty = mirror_y(t)
+    return board, x, y, mirror_y(x), t, tx, ty, mirror_y(tx)
+
+
+def transform(board, symmetry):
+    return symmetries(board)[symmetry]
+
+
+def canonical(board):
+    """Return (canonical board, symmetry) with canonical board == transform(board, symmetry)."""
+    images = symmetries(board)
+    smallest = min(images)
+    return smallest, images.index(smallest)
+
+
+def canonical_state(gridstate):
+    """canonical() for an export_state() grid."""
+    return canonical(pack_state(gridstate))
+
+
+def to_canonical_move(move, symmetry):
+    """The move on the transformed board that does what move does on the original."""
+    return MOVE_MAPS[symmetry][move]
+
+
+def from_canonical_move(move, symmetry):
+    """The move on the original board that does what move does on the transformed one."""
+    return MOVE_MAPS[INVERSE[symmetry]][move]
+
+
+def check(boards=1000, seed=0):
+    """Check the packed transforms and move maps against the permutations on random boards."""
+    from py2048_bitboard import MOVE_FUNCTIONS
+    from py2048_classes import RandomStream
+
+    rng = RandomStream(seed)
+    for _ in range(boards):
+        cells = [rng.randbelow(4) for _ in range(16)]
+        board = sum(v << (4 * i) for i, v in enumerate(cells))
+        for s, image in enumerate(symmetries(board)):
+            moved = [0] * 16
+            for i, v in enumerate(cells):
+                moved[PERMUTATIONS[s][i]] = v
+            assert image == sum(v << (4 * i) for i, v in enumerate(moved)), (board, s)
+            assert transform(image, INVERSE[s]) == board
+            for move in MOVES:
+                after = MOVE_FUNCTIONS[move](board)[0]
+                mapped = to_canonical_move(move, s)
+                assert MOVE_FUNCTIONS[mapped](image)[0] == transform(after, s), (board, s, move)
+                assert from_canonical_move(mapped, s) == move
+    return boards
+
+
+if __name__ == "__main__":
+    import time
+
+    print("checked", check(), "boards")
+    from py2048_classes import RandomStream
+    rng = RandomStream(1)
+    samples = [rng.seed_value() for _ in range(100000)]
+    begin = time.perf_counter()
+    for board in samples:
+        canonical(board)
+    print("canonical(): {:.2f} us".format((time.perf_counter() - begin) / len(samples) * 1e6))
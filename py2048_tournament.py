@@ -0,0 +1,148 @@
+"""
+Python 2048 Game : Parallel Tournament Runner
+
+Spreads N full games over a process pool.  Every game gets its own seed,
+derived from one tournament seed, and game records stream back to a single
+aggregator as soon as each game finishes:
+
+    python py2048_tournament.py --games 200 --workers 32 --agent expectimax
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import sys
+
+import MatthewStarkey2048
+from py2048_book import OpeningBook
+from py2048_classes import RandomStream
+from py2048_render import QuietRenderer
+from py2048_results import ResultsSummary, ResultsWriter
+
+AGENTS = ('montecarlo', 'expectimax', 'mcts', 'ntuple')
+
+
+def make_agent(name, time_limit, seed, weights='weights.ntn'):
+    """Build a fresh agent by name; 'montecarlo' is the built-in flat search and returns None.
+
+    weights is the py2048_ntuple weights file for the 'ntuple' agent.
+    """
+    if name == 'montecarlo':
+        return None
+    if name == 'expectimax':
+        from py2048_expectimax import ExpectimaxAgent
+        return ExpectimaxAgent()
+    if name == 'mcts':
+        from py2048_mcts import MCTSAgent
+        return MCTSAgent(time_limit=time_limit, rng=RandomStream(seed))
+    if name == 'ntuple':
+        from py2048_ntuple import NTupleAgent, NTupleNetwork
+        return NTupleAgent(NTupleNetwork.load(weights))
+    raise ValueError("unknown agent {!r}; expected one of {}".format(name, ', '.join(AGENTS)))
+
+
+class _Collector:
+    """Stands in for a ResultsWriter inside a worker and keeps the last record."""
+
+    record = None
+
+    def write(self, record):
+        self.record = record
+
+
+def play_seeded_game(agent_name, seed, weights='weights.ntn', book_path=None, **settings):
+    """Play one game without output and return its results record.
+
+    settings are further MatthewStarkey2048.main() keyword arguments; book_path
+    names a py2048_book file, opened read-only for the game.
+    """
+    collector = _Collector()
+    agent = make_agent(agent_name, settings.get('time_limit', 2.95), seed, weights)
+    book = OpeningBook(book_path, writable=False) if book_path else None
+    try:
+        MatthewStarkey2048.main(agent=agent, seed=seed, results=collector, renderer=QuietRenderer(), book=book,
+                                **settings)
+    finally:
+        if book is not None:
+            book.close()
+    return collector.record
+
+
+def play_game(task):
+    """Pool entry point: play one game and return its results record."""
+    game, seed, agent_name, time_limit, rollouts, confidence, weights, book_path = task
+    record = play_seeded_game(agent_name, seed, weights, book_path, time_limit=time_limit, rollouts=rollouts,
+                              confidence=confidence)
+    record.update(game=game, agent=agent_name, time_limit=time_limit)
+    return record
+
+
+def game_seeds(seed, games):
+    stream = RandomStream(seed)
+    return [stream.seed_value() for _ in range(games)]
+
+
+def confidence_interval(summary, z=1.96):
+    """Normal-approximation interval for the mean score."""
+    if summary.score.count < 2:
+        return summary.score.mean, summary.score.mean
+    half = z * math.sqrt(summary.score.variance() / summary.score.count)
+    return summary.score.mean - half, summary.score.mean + half
+
+
+def run_tournament(games, workers=None, agent='montecarlo', time_limit=2.95, rollouts=None, seed=0,
+                   results=None, on_game=None, confidence=None, weights='weights.ntn', book=None):
+    """Play games across a pool of workers and return the aggregate summary.
+
+    results is an optional ResultsWriter for every game record; on_game is
+    called with (record, summary) as each game finishes.  confidence turns on
+    racing in the montecarlo search (see MatthewStarkey2048.main); weights is
+    the weights file for the ntuple agent.  book is a py2048_book file every
+    montecarlo game consults read-only.
+    """
+    make_agent(agent, time_limit, 0, weights)
+    tasks = [(game, game_seed, agent, time_limit, rollouts, confidence, weights, book)
+             for game, game_seed in enumerate(game_seeds(seed, games))]
+    summary = ResultsSummary()
+    with multiprocessing.Pool(workers) as pool:
+        for record in pool.imap_unordered(play_game, tasks):
+            summary.add(record)
+            if results is not None:
+                results.write(record)
+            if on_game is not None:
+                on_game(record, summary)
+    report = summary.as_dict()
+    report['score_ci95'] = confidence_interval(summary)
+    report.update(agent=agent, time_limit=time_limit, rollouts=rollouts, seed=seed, confidence=confidence, book=book)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=None, help="default: one per CPU")
+    parser.add_argument('--agent', choices=AGENTS, default='montecarlo')
+    parser.add_argument('--time-limit', type=float, default=2.95, help="seconds per move")
+    parser.add_argument('--rollouts', type=int, default=None, help="fixed rollouts per candidate (montecarlo)")
+    parser.add_argument('--confidence', type=float, default=None,
+                        help="race candidates, dropping moves this many standard errors behind (montecarlo)")
+    parser.add_argument('--weights', default='weights.ntn', help="n-tuple weights file (ntuple)")
+    parser.add_argument('--book', help="opening book file to consult read-only (montecarlo)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', help="append every game record to this JSONL file")
+    args = parser.parse_args()
+
+    def progress(record, summary):
+        low, high = confidence_interval(summary)
+        print("game {:>4} score {:>7} max tile {:>5}   mean {:9.1f}  95% CI [{:.1f}, {:.1f}]".format(
+            record['game'], record['score'], record['max_tile'], summary.score.mean, low, high), file=sys.stderr)
+
+    writer = ResultsWriter(args.results) if args.results else None
+    try:
+        report = run_tournament(args.games, args.workers, args.agent, args.time_limit, args.rollouts, args.seed,
+                                writer, progress, args.confidence, args.weights, args.book)
+    finally:
+        if writer is not None:
+            writer.close()
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,162 @@
+"""
+Python 2048 Game : Compact Binary Game Records
+
+A trajectory file is the magic FILE_MAGIC followed by game blocks.  Each block
+is a GAME header (magic, ply count, seed, final score) followed by fixed-size
+PLY records:
+
+    board        uint64  packed state before the move (py2048_bitboard layout)
+    move         uint8   index into MOVES, or NO_MOVE for the final position
+    spawn_cell   uint8   cell 4 * y + x of the tile spawned after the move, or NO_SPAWN
+    spawn_value  uint8   exponent of the spawned tile
+    score        uint32  score of the board before the move
+
+TrajectoryWriter buffers one game and appends it when the game ends.
+TrajectoryReader memory-maps a file, indexes the games by hopping from header
+to header and reads plies straight out of the mapping.
+"""
+
+import bisect
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from py2048_bitboard import MOVES, pack_state
+
+FILE_MAGIC = b'2048TRJ1'
+GAME = struct.Struct('<4sIQQ')
+GAME_MAGIC = b'GAME'
+PLY = struct.Struct('<QBBBxI')
+NO_MOVE = 255
+NO_SPAWN = 255
+
+MOVE_CODES = {move: code for code, move in enumerate(MOVES)}
+
+Ply = namedtuple('Ply', 'board move spawn_cell spawn_value score')
+GameInfo = namedtuple('GameInfo', 'offset plies seed score')
+
+
+class TrajectoryWriter:
+    """Append games to a trajectory file, one buffered game at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(FILE_MAGIC)
+        self._plies = bytearray()
+        self._count = 0
+        self._seed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start_game(self, seed=None):
+        """Begin buffering a game; seed must fit the header's unsigned 64-bit field."""
+        if seed is not None and not 0 <= seed < 2 ** 64:
+            raise ValueError("seed {} does not fit an unsigned 64-bit trajectory header".format(seed))
+        self._plies = bytearray()
+        self._count = 0
+        self._seed = seed or 0
+
+    def record(self, gridstate, move, spawn, score):
+        """Record one ply: the export_state() grid before move, the spawn that followed and the prior score.
+
+        spawn is Board.last_spawn() after the tile was added, or None.
+        """
+        cell, value = spawn if spawn is not None else (NO_SPAWN, 0)
+        self._plies += PLY.pack(pack_state(gridstate), MOVE_CODES[move], cell, value, score)
+        self._count += 1
+
+    def end_game(self, gridstate, score):
+        """Record the final position and append the whole game to the file."""
+        self._plies += PLY.pack(pack_state(gridstate), NO_MOVE, NO_SPAWN, 0, score)
+        self._count += 1
+        self._file.write(GAME.pack(GAME_MAGIC, self._count, self._seed, score))
+        self._file.write(self._plies)
+        self._file.flush()
+        self._plies = bytearray()
+        self._count = 0
+
+    def close(self):
+        self._file.close()
+
+
+class TrajectoryReader:
+    """Memory-mapped, zero-copy access to the plies of a trajectory file."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if size and self._map[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError("{} is not a trajectory file".format(path))
+        self.games = []
+        self._starts = []
+        total = 0
+        offset = len(FILE_MAGIC)
+        while offset + GAME.size <= size:
+            magic, plies, seed, score = GAME.unpack_from(self._map, offset)
+            if magic != GAME_MAGIC or offset + GAME.size + plies * PLY.size > size:
+                break  # a truncated trailing game is ignored
+            self.games.append(GameInfo(offset + GAME.size, plies, seed, score))
+            self._starts.append(total)
+            total += plies
+            offset += GAME.size + plies * PLY.size
+        self.total_plies = total
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.total_plies
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def ply(self, index):
+        """Return the index-th ply across all games."""
+        if not 0 <= index < self.total_plies:
+            raise IndexError(index)
+        game = bisect.bisect_right(self._starts, index) - 1
+        offset = self.games[game].offset + (index - self._starts[game]) * PLY.size
+        return Ply._make(PLY.unpack_from(self._map, offset))
+
+    def iter_game(self, game):
+        """Yield the plies of one game without copying the underlying bytes."""
+        info = self.games[game]
+        view = memoryview(self._map)[info.offset:info.offset + info.plies * PLY.size]
+        try:
+            for fields in PLY.iter_unpack(view):
+                yield Ply._make(fields)
+        finally:
+            view.release()
+
+    def iter_plies(self):
+        for game in range(len(self.games)):
+            yield from self.iter_game(game)
+
+    def sample(self, count, rng):
+        """Return count plies drawn uniformly (with replacement) using a RandomStream."""
+        return [self.ply(rng.randbelow(self.total_plies)) for _ in range(count)]
+
+    def game_array(self, game):
+        """The plies of one game as a zero-copy NumPy structured array.
+
+        The array borrows the mapping, so drop it before calling close().
+        """
+        import numpy as np
+
+        dtype = np.dtype([('board', '<u8'), ('move', 'u1'), ('spawn_cell', 'u1'), ('spawn_value', 'u1'),
+                          ('pad', 'u1'), ('score', '<u4')])
+        info = self.games[game]
+        return np.frombuffer(self._map, dtype=dtype, count=info.plies, offset=info.offset)